@@ -0,0 +1,30 @@
+import random
+
+TOPICS = ["python", "travel", "cooking", "finance", "history", "music", "fitness", "astronomy", "gardening", "chess",
+          "databases", "networking", "poetry", "biology", "linguistics", "photography"]
+VERBS = ["explain", "compare", "summarize", "debug", "plan", "recommend", "translate", "outline"]
+TAKEAWAYS = ["Answered directly.", "Too verbose.", "Missed the user's intent.", "Good use of examples.", "Needed a clarifying question."]
+RULE_TYPES = ["CORE_RULE", "RESPONSE_PRINCIPLE", "BEHAVIORAL_ADJUSTMENT", "GENERAL_LEARNING"]
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(TOPICS + VERBS) for _ in range(words))
+
+def synthetic_memories(n: int, seed: int = 0, start: int = 0):
+    """Yields `n` reproducible memory dicts in the shape add_memories_bulk expects, numbered from `start`."""
+    rng = random.Random(seed)
+    for i in range(start, start + n):
+        topic, verb = rng.choice(TOPICS), rng.choice(VERBS)
+        yield {"user_input": f"Can you {verb} something about {topic}? (#{i})",
+               "bot_response": f"Here is how to {verb} {topic}: " + _sentence(rng, rng.randint(10, 60)),
+               "metrics": {"takeaway": rng.choice(TAKEAWAYS), "score": round(rng.random(), 2)},
+               "timestamp": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00"}
+
+def synthetic_rules(n: int, seed: int = 0, start: int = 0):
+    """Yields `n` distinct, reproducible rules with a `[TYPE|SCORE]` prefix, numbered from `start`."""
+    rng = random.Random(seed + 1)
+    for i in range(start, start + n):
+        yield f"[{rng.choice(RULE_TYPES)}|{rng.random():.2f}] When asked about {rng.choice(TOPICS)}, {rng.choice(VERBS)} clearly. ({i})"
+
+def synthetic_queries(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed + 2)
+    return [f"{rng.choice(VERBS)} {rng.choice(TOPICS)} {_sentence(rng, 4)}" for _ in range(n)]
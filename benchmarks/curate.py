@@ -0,0 +1,158 @@
+"""
+End-to-end benchmark of the batch reflective-learning pipeline against the local stub LLM
+(benchmarks/stub_llm.py), so it runs offline and reproducibly.
+
+It curates the same interactions one at a time and with bounded concurrency, and checks that
+every response parsed to exactly the operations the stub sent. It then applies them with one
+apply_rule_updates() call and, after reseeding the rules, one at a time with add_rule_entry and
+replace_rule_entry, and checks that both leave the same rules as a reference model. It also checks
+that the stub never saw more requests in flight, or faster, than the configured limits. Exits 1
+if any check fails.
+
+  python -m benchmarks.curate --rules 2000 --interactions 400 --concurrency 16 [--rate-limit 6000] [--backend SQLITE]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import argparse
+
+PROVIDER, MODEL = "groq", "Llama 3 8B (Groq)" # Any OpenAI-compatible provider in models.json; its URL is pointed at the stub
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch learning-loop benchmark against a stub LLM.")
+    parser.add_argument("--backend", default="RAM", choices=["RAM", "SQLITE"])
+    parser.add_argument("--rules", type=int, default=2000, help="Rules loaded before curating.")
+    parser.add_argument("--interactions", type=int, default=400)
+    parser.add_argument("--serial", type=int, default=50, help="Interactions curated one at a time for the baseline.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--provider-concurrency", type=int, default=64, help="LLM_MAX_CONCURRENCY for the run.")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Requests per minute to the provider; 0 = unlimited.")
+    parser.add_argument("--rules-k", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Stub delay before the first token.")
+    parser.add_argument("--chunk-delay-ms", type=float, default=2, help="Stub delay between streamed chunks.")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+def _expected_rules(rules: set, operations: list) -> set:
+    """Reference model: the rules left after applying `operations` in order, one at a time."""
+    rules = set(rules)
+    for op in operations:
+        new, old = op["insight"], op.get("old_insight_to_replace")
+        if op["action"] == "update" and old:
+            if old == new: continue
+            rules.discard(old)
+        rules.add(new)
+    return rules
+
+def _curate(interactions: list, concurrency: int, rules_k: int) -> tuple:
+    from ilearn_memory.learning import curate_rules_batch
+    from ilearn_memory.transport import aclose_clients
+
+    async def run():
+        try:
+            return await curate_rules_batch(interactions, PROVIDER, MODEL, concurrency=concurrency, rules_k=rules_k, apply=False)
+        finally:
+            await aclose_clients()
+    started = time.perf_counter()
+    result = asyncio.run(run())
+    return result, time.perf_counter() - started
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="ilearn-curate-")
+    try:
+        return _run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _run(args, workdir: str) -> dict:
+    from benchmarks import stub_llm
+    server, stats, url = stub_llm.start(latency_ms=args.latency_ms, chunk_delay_ms=args.chunk_delay_ms)
+    os.environ.update({"STORAGE_BACKEND": args.backend, "SQLITE_DB_PATH": os.path.join(workdir, "curate.db"),
+                       "INDEX_SNAPSHOT_ENABLED": "false", "EMBEDDING_CACHE_ENABLED": "false", "INSIGHT_MODEL_OVERRIDE": "",
+                       f"{PROVIDER.upper()}_API_KEY": "stub", f"{PROVIDER.upper()}_API_URL": url,
+                       "LLM_MAX_CONCURRENCY": str(args.provider_concurrency), "LLM_RATE_LIMITS": f"{PROVIDER}={args.rate_limit}" if args.rate_limit else ""})
+    from benchmarks.corpus import synthetic_memories, synthetic_rules
+    from benchmarks.stub_embedder import HashingEmbedder
+    from ilearn_memory import storage
+
+    storage.initialize_memory_system(embedder=HashingEmbedder(args.dimension))
+    if not storage.wait_until_ready(): raise SystemExit("initialize_memory_system() failed; FAISS and numpy are required.")
+    seed_rules = list(synthetic_rules(args.rules, args.seed))
+    storage.add_rules_bulk(seed_rules)
+    initial = set(storage.get_all_rules_cached())
+    interactions = [f"User asked '{m['user_input']}', AI responded '{m['bot_response'][:200]}'" for m in synthetic_memories(args.interactions, args.seed)]
+    failures = []
+
+    serial, serial_seconds = _curate(interactions[:args.serial], 1, args.rules_k)
+    requests_before = stats.to_dict()["requests"]
+    batch, batch_seconds = _curate(interactions, args.concurrency, args.rules_k)
+    stub = stats.to_dict()
+    server.shutdown()
+
+    # Every response must parse to exactly the operations the stub rendered for it
+    relevant = storage.retrieve_semantic_batch(interactions, 0, args.rules_k)
+    for n, (summary, found) in enumerate(zip(interactions, relevant)):
+        expected = stub_llm.operations_for(summary, found["rules"])
+        if batch["operations"][n] != expected: failures.append(f"interaction {n}: parsed {batch['operations'][n]}, stub sent {expected}")
+        if n < args.serial and serial["operations"][n] != expected: failures.append(f"interaction {n}: serial run parsed {serial['operations'][n]}")
+    if batch["failed"] or serial["failed"]: failures.append(f"failed interactions: {batch['failed'] or serial['failed']}")
+    if stub["max_in_flight"] > min(args.concurrency, args.provider_concurrency):
+        failures.append(f"{stub['max_in_flight']} requests in flight, limit {min(args.concurrency, args.provider_concurrency)}")
+    batch_requests = stub["requests"] - requests_before
+    if args.rate_limit and batch_requests > 1:
+        allowed = args.rate_limit / 60 * batch_seconds + 1
+        if batch_requests > allowed * 1.05: failures.append(f"{batch_requests} requests in {batch_seconds:.2f}s exceed {args.rate_limit}/min")
+
+    operations = [op for ops in batch["operations"] for op in ops]
+    expected_rules = _expected_rules(initial, operations)
+    started = time.perf_counter()
+    applied = storage.apply_rule_updates(operations)
+    batched_apply_seconds = time.perf_counter() - started
+    batched_rules = set(storage.get_all_rules_cached())
+    if batched_rules != expected_rules:
+        failures.append(f"batched apply: {len(batched_rules - expected_rules)} unexpected and {len(expected_rules - batched_rules)} missing rules")
+    if storage._sqlite_store:
+        stored = {text for _, text, _ in storage._sqlite_store.load("rule")}
+        if stored != batched_rules: failures.append(f"{len(stored)} rules in SQLite differ from the {len(batched_rules)} in the index")
+
+    # The same operations one at a time, from the same starting rules
+    storage.clear_all_rules_data_backend()
+    storage.add_rules_bulk(seed_rules)
+    started = time.perf_counter()
+    for op in operations:
+        if op["action"] == "update" and op.get("old_insight_to_replace"): storage.replace_rule_entry(op["old_insight_to_replace"], op["insight"])
+        elif op["action"] in ("add", "update"): storage.add_rule_entry(op["insight"])
+    sequential_apply_seconds = time.perf_counter() - started
+    sequential_rules = set(storage.get_all_rules_cached())
+    if sequential_rules != expected_rules: failures.append("sequential apply disagrees with the reference model")
+
+    return {"config": {"backend": args.backend, "rules": args.rules, "interactions": args.interactions, "serial": args.serial,
+                       "concurrency": args.concurrency, "provider_concurrency": args.provider_concurrency, "rate_limit": args.rate_limit,
+                       "latency_ms": args.latency_ms, "chunk_delay_ms": args.chunk_delay_ms},
+            "serial": {"interactions": len(serial["operations"]), "seconds": round(serial_seconds, 3),
+                       "interactions_per_s": round(len(serial["operations"]) / serial_seconds, 1)},
+            "batch": {"interactions": len(interactions), "seconds": round(batch_seconds, 3),
+                      "interactions_per_s": round(len(interactions) / batch_seconds, 1), "max_in_flight": stub["max_in_flight"]},
+            "speedup": round((len(interactions) / batch_seconds) / (len(serial["operations"]) / serial_seconds), 2) if serial_seconds else None,
+            "operations": len(operations), "applied": applied,
+            "apply": {"batched_seconds": round(batched_apply_seconds, 4), "sequential_seconds": round(sequential_apply_seconds, 4),
+                      "speedup": round(sequential_apply_seconds / batched_apply_seconds, 1) if batched_apply_seconds else None},
+            "failures": len(failures), "failure_samples": failures[:20]}
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    result = run(args)
+    payload = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(payload + "\n")
+    print(payload)
+    return 1 if result["failures"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
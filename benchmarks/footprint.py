@@ -0,0 +1,56 @@
+"""
+Resident size of the memory store in its three layouts, for synthetic memories: {id: JSON string}
+(the original layout), {id: MemoryRecord} (new memories, before a merge) and the MemoryTable a
+merged base index holds. Bytes are traced with tracemalloc and normalised per 100k memories; the
+full read is one pass turning every memory into a dict, as get_all_memories_cached does.
+
+  python -m benchmarks.footprint --memories 100000 [--output footprint.json]
+"""
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+def _measure(build, read, n: int) -> dict:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    started = time.perf_counter()
+    read(held)
+    return {"bytes_per_100k": used * 100_000 // n, "full_read_s": round(time.perf_counter() - started, 3)}
+
+def run(n: int, seed: int = 0) -> dict:
+    from benchmarks.corpus import synthetic_memories
+    from ilearn_memory.indexing import item_id
+    from ilearn_memory.records import MemoryRecord, MemoryTable
+
+    memories = [json.dumps(m) for m in synthetic_memories(n, seed)]
+    ids = [item_id(m) for m in memories]
+    # Copies, so each layout is charged for its own strings rather than sharing the ones above
+    def json_strings(): return {i: (m + " ")[:-1] for i, m in zip(ids, memories)}
+    def records(): return {i: MemoryRecord.from_json(m) for i, m in zip(ids, memories)}
+    results = {"memories": n,
+               "json_strings": _measure(json_strings, lambda held: [json.loads(m) for m in held.values()], n),
+               "memory_records": _measure(records, lambda held: [r.to_dict() for r in held.values()], n),
+               "memory_table": _measure(lambda: MemoryTable.from_items(records().items()), lambda held: [r.to_dict() for r in held.values()], n)}
+    baseline = results["json_strings"]["bytes_per_100k"]
+    for layout in ("memory_records", "memory_table"): results[layout]["vs_json_strings"] = round(results[layout]["bytes_per_100k"] / baseline, 2)
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Memory footprint of the memory store layouts.")
+    parser.add_argument("--memories", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+    payload = json.dumps(run(args.memories, args.seed), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(payload + "\n")
+    print(payload)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
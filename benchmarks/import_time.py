@@ -0,0 +1,47 @@
+"""
+Measures cold import cost of ilearn_memory entry points, each in fresh interpreters.
+
+  python -m benchmarks.import_time --runs 5 [--output import_time.json]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATEMENTS = {
+    "package": "import ilearn_memory",
+    "llm_only": "from ilearn_memory.llm import call_model_stream",
+    "storage_api": "import ilearn_memory; ilearn_memory.add_rule_entry",
+    "learning": "from ilearn_memory import generate_rule_updates",
+}
+_PROBE = "import sys, time; t = time.perf_counter(); {stmt}; print(time.perf_counter() - t, len(sys.modules))"
+
+def measure(statement: str, runs: int) -> dict:
+    """Median wall time of `statement` in `runs` new interpreters, plus how many modules it left loaded."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in (REPO_ROOT, os.environ.get("PYTHONPATH")) if p))
+    timings, modules = [], 0
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", _PROBE.format(stmt=statement)], cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {"statement": statement, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+        elapsed, modules = proc.stdout.split()
+        timings.append(float(elapsed))
+    return {"statement": statement, "median_ms": round(statistics.median(timings) * 1000, 2), "modules_loaded": int(modules)}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cold import time of ilearn_memory entry points.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+    results = {name: measure(stmt, args.runs) for name, stmt in STATEMENTS.items()}
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(payload + "\n")
+    print(payload)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
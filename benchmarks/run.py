@@ -0,0 +1,202 @@
+"""
+Reproducible benchmarks for ingest, retrieval, persistence and startup.
+
+Every (backend, size) scenario runs in fresh worker processes so configuration read at import time,
+caches and peak RSS never leak between scenarios:
+
+  1. ingest  - cold start on an empty store, bulk ingest of `size` rules and memories, single-item
+               adds, semantic retrieval, then flush() and index snapshots.
+  2. startup - a new process that imports ilearn_memory and loads what phase 1 persisted.
+
+Examples:
+  python -m benchmarks.run --sizes 1000 10000 --output results.json
+  python -m benchmarks.run --save-baseline benchmarks/baseline.json
+  python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.25   # exits 1 on regression
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+BACKENDS = {
+    "RAM": {"STORAGE_BACKEND": "RAM"},
+    "SQLITE": {"STORAGE_BACKEND": "SQLITE"},
+    # Local stand-in for HF_DATASET: same persister and delta shards, written to a directory
+    "HF_LOCAL": {"STORAGE_BACKEND": "HF_DATASET", "HF_MEMORY_DATASET_REPO": "bench/memories", "HF_RULES_DATASET_REPO": "bench/rules"},
+}
+DEFAULT_SIZES = [1000, 10000, 100000]
+HIGHER_IS_BETTER = ("_per_s", "_qps")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _peak_rss_mb() -> float:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1) # Bytes on macOS, KiB on Linux
+
+def _latencies(prefix: str, latencies_s: list) -> dict:
+    from ilearn_memory.retrieval import latency_summary
+    summary = latency_summary(latencies_s)
+    return {f"{prefix}_p50_ms": round(summary["p50_ms"], 3), f"{prefix}_p99_ms": round(summary["p99_ms"], 3)}
+
+def _timed_calls(fn, args_list: list) -> list:
+    latencies = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def _run_ingest(ilearn_memory, args) -> dict:
+    from benchmarks.corpus import synthetic_memories, synthetic_rules, synthetic_queries
+    result = {}
+    for item_type, bulk, corpus in (("rule", ilearn_memory.add_rules_bulk, synthetic_rules), ("memory", ilearn_memory.add_memories_bulk, synthetic_memories)):
+        started = time.perf_counter()
+        added = bulk(corpus(args.size, args.seed))
+        result[f"bulk_{item_type}_ingest_per_s"] = round(added / (time.perf_counter() - started), 1)
+
+    extra_memories = [(m["user_input"], m["metrics"], m["bot_response"]) for m in synthetic_memories(args.single_adds, args.seed, start=args.size)]
+    result.update(_latencies("add_memory", _timed_calls(ilearn_memory.add_memory_entry, extra_memories)))
+    extra_rules = [(r,) for r in synthetic_rules(args.single_adds, args.seed, start=args.size)]
+    result.update(_latencies("add_rule", _timed_calls(ilearn_memory.add_rule_entry, extra_rules)))
+
+    queries = [(q,) for q in synthetic_queries(args.queries, args.seed)]
+    started = time.perf_counter()
+    memory_latencies = _timed_calls(ilearn_memory.retrieve_memories_semantic, queries)
+    rule_latencies = _timed_calls(ilearn_memory.retrieve_rules_semantic, queries)
+    result["retrieval_qps"] = round(len(queries) / (time.perf_counter() - started), 1) # One memory + one rule lookup per query
+    result.update(_latencies("retrieve_memories", memory_latencies))
+    result.update(_latencies("retrieve_rules", rule_latencies))
+
+    started = time.perf_counter()
+    ilearn_memory.flush()
+    result["flush_s"] = round(time.perf_counter() - started, 4)
+    started = time.perf_counter()
+    ilearn_memory.save_index_snapshots()
+    result["snapshot_s"] = round(time.perf_counter() - started, 4)
+    return result
+
+def _worker(args):
+    """Runs one phase in this process and prints its metrics as a single JSON line on stdout."""
+    from benchmarks.stub_embedder import HashingEmbedder
+    started = time.perf_counter()
+    import ilearn_memory
+    from ilearn_memory import storage
+    import_s = time.perf_counter() - started
+    started = time.perf_counter()
+    ilearn_memory.initialize_memory_system(embedder=HashingEmbedder(args.dimension))
+    init_s = time.perf_counter() - started
+    if not storage._initialized: raise SystemExit("initialize_memory_system() failed; FAISS and numpy are required.")
+
+    if args.phase == "ingest":
+        result = {"cold_start_s": round(init_s, 4)}
+        result.update(_run_ingest(ilearn_memory, args))
+        result["ingest_peak_rss_mb"] = _peak_rss_mb()
+    else:
+        result = {"import_s": round(import_s, 4), "startup_s": round(init_s, 4), "startup_items": sum(len(store.current) for store in storage._stores.values()),
+                  "startup_peak_rss_mb": _peak_rss_mb()}
+    print(json.dumps(result))
+
+def _scenario_env(backend: str, workdir: str) -> dict:
+    env = dict(os.environ)
+    env.update(BACKENDS[backend])
+    env.update({
+        "SQLITE_DB_PATH": os.path.join(workdir, "bench.db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.db"),
+        "INDEX_SNAPSHOT_DIR": os.path.join(workdir, "faiss_snapshots"),
+        "HF_LOCAL_HUB_DIR": os.path.join(workdir, "hub") if backend == "HF_LOCAL" else "",
+        # Measure the uncached search path, and let flush() rather than the timer push HF writes
+        "QUERY_CACHE_SIZE": "0", "RESULT_CACHE_SIZE": "0",
+        "HF_PERSIST_FLUSH_INTERVAL": "3600", "HF_PERSIST_MAX_PENDING": str(10 ** 9),
+        "PYTHONPATH": os.pathsep.join(p for p in (REPO_ROOT, env.get("PYTHONPATH")) if p),
+    })
+    return env
+
+def _run_phase(phase: str, backend: str, size: int, workdir: str, args) -> dict:
+    cmd = [sys.executable, "-m", "benchmarks.run", "--worker", phase, "--sizes", str(size), "--seed", str(args.seed),
+           "--queries", str(args.queries), "--single-adds", str(args.single_adds), "--dimension", str(args.dimension)]
+    proc = subprocess.run(cmd, cwd=REPO_ROOT, env=_scenario_env(backend, workdir), capture_output=True, text=True, timeout=args.timeout)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{backend}/{size} {phase} phase failed (exit {proc.returncode}):\n{proc.stderr[-4000:]}{proc.stdout[-1000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def run_benchmarks(args) -> dict:
+    scenarios = {}
+    for size in args.sizes:
+        for backend in args.backends:
+            workdir = tempfile.mkdtemp(prefix=f"ilearn-bench-{backend.lower()}-{size}-")
+            try:
+                print(f"Running {backend}/{size} ...", file=sys.stderr, flush=True)
+                metrics = _run_phase("ingest", backend, size, workdir, args)
+                metrics.update(_run_phase("startup", backend, size, workdir, args))
+                scenarios[f"{backend}/{size}"] = metrics
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+    return {"meta": {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "platform": platform.platform(),
+                     "cpu_count": os.cpu_count(), "embedder": f"stub-hashing-{args.dimension}", "seed": args.seed, "queries": args.queries,
+                     "single_adds": args.single_adds, "faiss_index_factory": os.getenv("FAISS_INDEX_FACTORY", "Flat")},
+            "scenarios": scenarios}
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a line per metric that is more than `tolerance` (a fraction) worse than the baseline."""
+    regressions = []
+    for scenario, base_metrics in baseline.get("scenarios", {}).items():
+        current = results["scenarios"].get(scenario)
+        if current is None: continue
+        for name, base in base_metrics.items():
+            value = current.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or base <= 0 or name == "startup_items": continue
+            higher_is_better = name.endswith(HIGHER_IS_BETTER)
+            change = (base - value) / base if higher_is_better else (value - base) / base
+            if change > tolerance:
+                regressions.append(f"{scenario} {name}: {base} -> {value} ({change:+.0%} worse)")
+    return regressions
+
+def _print_table(results: dict):
+    for scenario, metrics in results["scenarios"].items():
+        print(f"\n{scenario}", file=sys.stderr)
+        for name, value in metrics.items():
+            print(f"  {name:<28} {value}", file=sys.stderr)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="iLearn memory benchmarks (offline, stub embedder).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--queries", type=int, default=500, help="Retrieval queries per scenario.")
+    parser.add_argument("--single-adds", type=int, default=200, help="add_memory_entry / add_rule_entry calls timed per scenario.")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=3600, help="Seconds allowed per worker process.")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout).")
+    parser.add_argument("--save-baseline", help="Also write results JSON to this baseline path.")
+    parser.add_argument("--baseline", help="Compare against this baseline JSON and exit 1 on regression.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed fractional slowdown per metric before failing.")
+    parser.add_argument("--worker", choices=["ingest", "startup"], help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        args.phase, args.size = args.worker, args.sizes[0]
+        _worker(args)
+        return 0
+
+    results = run_benchmarks(args)
+    _print_table(results)
+    payload = json.dumps(results, indent=2)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f: f.write(payload + "\n")
+    if not args.output: print(payload)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nREGRESSIONS (tolerance {args.tolerance:.0%}):\n  " + "\n  ".join(regressions), file=sys.stderr)
+            return 1
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%}).", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
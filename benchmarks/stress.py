@@ -0,0 +1,253 @@
+"""
+Multithreaded stress test of concurrent reads and writes against the snapshot store.
+
+Reader threads search continuously while writer threads add, replace and remove rules and add
+memories. Every read is checked against the snapshot it ran on, and a sample of snapshots is
+checked against an exact brute-force search over the same items. Afterwards every store is
+compacted and a sample of its items must find itself and read back its own vector. Read
+throughput is reported with and without concurrent writes. Exits 1 if any check fails.
+
+  python -m benchmarks.stress --size 20000 --readers 4 --writers 2 --seconds 10 [--backend SQLITE] [--output stress.json]
+  python -m benchmarks.stress --factory IVF64,Flat --train-threshold 1000   # an approximate index; see --nprobe
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import itertools
+import threading
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent read/write stress test of ilearn_memory storage.")
+    parser.add_argument("--backend", default="RAM", choices=["RAM", "SQLITE"])
+    parser.add_argument("--size", type=int, default=20000, help="Rules and memories loaded before the test.")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of each phase.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--exact-checks", type=int, default=50, help="Snapshots compared against brute-force search.")
+    parser.add_argument("--factory", default="Flat", help="FAISS_INDEX_FACTORY for the run, e.g. IVF64,Flat or HNSW32.")
+    parser.add_argument("--train-threshold", type=int, default=1000, help="FAISS_TRAIN_THRESHOLD when --factory is not Flat.")
+    parser.add_argument("--nprobe", type=int, default=None, help="FAISS_NPROBE for IVF. Brute-force checks only run when the search is exact (nprobe >= nlist).")
+    parser.add_argument("--self-checks", type=int, default=500, help="Items per store that must find themselves after the run.")
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+class _Failures:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count, self.samples = 0, []
+
+    def add(self, message: str):
+        with self._lock:
+            self.count += 1
+            if len(self.samples) < 20: self.samples.append(message)
+
+def _reader(storage, queries, args, stop, failures, latencies, samples, sample_slots):
+    rng = random.Random(threading.get_ident())
+    while not stop.is_set():
+        item_type = rng.choice(("memory", "rule"))
+        query = rng.choice(queries)
+        started = time.perf_counter()
+        snapshot = storage._snapshot(item_type)
+        query_vectors = storage._embed_queries([query])
+        ids = storage._search_ids(snapshot, query_vectors, args.k, item_type)[0]
+        items = [snapshot[i] for i in ids if i in snapshot]
+        latencies.append(time.perf_counter() - started)
+
+        if len(items) != len(ids): failures.add(f"{item_type}: search returned ids missing from its own snapshot (v{snapshot.version})")
+        if len(set(ids)) != len(ids): failures.add(f"{item_type}: duplicate ids in one result (v{snapshot.version})")
+        if len(ids) != min(args.k, len(snapshot)): failures.add(f"{item_type}: {len(ids)} results from a snapshot of {len(snapshot)} (v{snapshot.version})")
+        if rng.random() < 0.01 and next(sample_slots) < args.exact_checks:
+            # Keep what the snapshot contained, not the snapshot itself, and verify after the timed phase
+            texts = {i: (v.embed_text if item_type == "memory" else v) for i, v in zip(snapshot, snapshot.values())}
+            samples.append((item_type, snapshot.version, query_vectors[0], ids, texts))
+
+def _verify_samples(embedder, samples, k: int, failures) -> int:
+    """Checks sampled searches against brute force over every item their snapshot held (the stub embedder is deterministic)."""
+    import numpy as np
+    vectors = {}
+    for item_type, version, query_vector, ids, texts in samples:
+        missing = [i for i in texts if i not in vectors]
+        if missing: vectors.update(zip(missing, embedder.encode([texts[i] for i in missing]).astype(np.float32)))
+        live = list(texts)
+        distances = ((np.vstack([vectors[i] for i in live]) - query_vector) ** 2).sum(axis=1)
+        by_id = dict(zip(live, distances))
+        # Compare distances rather than ids, so ties between equidistant items are not failures
+        expected = np.sort(distances)[:k]
+        if not np.allclose([by_id[i] for i in ids], expected, atol=1e-4):
+            failures.add(f"{item_type}: snapshot v{version} search disagrees with brute force")
+    return len(samples)
+
+def _exact_search(storage) -> bool:
+    """Whether searches are exact, so results can be compared with brute force: Flat, or IVF probing every list."""
+    from ilearn_memory import indexing
+    base = storage._snapshot("rule").base
+    ivf = indexing.faiss.try_extract_index_ivf(base.index)
+    return ivf.nprobe >= ivf.nlist if ivf is not None else indexing.is_flat(base)
+
+def _check_self_lookups(storage, embedder, count: int, failures) -> int:
+    """
+    Compacts each store, so removals reach its base index, then checks that a sample of its items
+    finds itself as the nearest neighbour (on Flat and uncompressed IVF, where that is guaranteed)
+    and that the index reads back each item's own vector.
+    """
+    import numpy as np
+    from ilearn_memory import indexing
+    checked = 0
+    for item_type, store in storage._stores.items():
+        snapshot = store.compact()
+        sample = random.Random(0).sample(list(zip(snapshot, snapshot.values())), min(count, len(snapshot)))
+        if not sample: continue
+        ids = [i for i, _ in sample]
+        kind = indexing.index_kind(snapshot.base)
+        lossy = any(code in kind for code in ("PQ", "SQ", "LSH")) # Compressed vectors come back approximate
+        # An item's own IVF list is always probed; a graph index such as HNSW may legitimately miss it
+        exhaustive = not lossy and (indexing.is_flat(snapshot.base) or indexing.faiss.try_extract_index_ivf(snapshot.base.index) is not None)
+        text = (lambda v: v.embed_text) if item_type == "memory" else (lambda v: v)
+        vectors = embedder.encode([text(v) for _, v in sample]).astype(np.float32)
+        found = storage._search_ids(snapshot, vectors, 1, item_type)
+        missed = [(n, f[0] if f else None) for n, f in enumerate(found) if f != [ids[n]]]
+        # The hashing stub gives some near-identical texts the same vector, so finding a tied twin is not a miss
+        twins = [(n, f) for n, f in missed if f is not None]
+        if twins:
+            twin_vectors = embedder.encode([text(snapshot[f]) for _, f in twins]).astype(np.float32)
+            tied = {n for (n, _), v in zip(twins, twin_vectors) if np.allclose(v, vectors[n], atol=1e-4)}
+            missed = [(n, f) for n, f in missed if n not in tied]
+        if missed and exhaustive: failures.add(f"{item_type}: {len(missed)} of {len(ids)} items did not find themselves ({kind})")
+        try:
+            indexed, stored = indexing.all_vectors(indexing.faiss.clone_index(snapshot.base))
+            position = {i: n for n, i in enumerate(indexed.tolist())}
+            mismatched = [i for i, v in zip(ids, vectors) if i not in position or not np.allclose(stored[position[i]], v, atol=1e-4)]
+            if mismatched and not lossy:
+                failures.add(f"{item_type}: the index reads back the wrong vector for {len(mismatched)} of {len(ids)} items")
+        except RuntimeError as e:
+            failures.add(f"{item_type}: reading the index's vectors failed: {e}")
+        checked += len(ids)
+    return checked
+
+def _writer(storage, number: int, stop, failures, counts):
+    from benchmarks.corpus import synthetic_memories
+    from ilearn_memory.indexing import item_id
+    rng = random.Random(number)
+    live, n = [], 0
+    while not stop.is_set():
+        n += 1
+        rule = f"[GENERAL_LEARNING|0.50] stress rule w{number}n{n} token{number}x{n}"
+        op = rng.random()
+        if op < 0.5 or not live:
+            storage.add_rule_entry(rule)
+            if item_id(rule) not in storage._snapshot("rule"): failures.add(f"added rule not visible after add_rule_entry returned: {rule}")
+            live.append(rule)
+            counts["rule_adds"] += 1
+        elif op < 0.7:
+            old = live.pop(rng.randrange(len(live)))
+            storage.replace_rule_entry(old, rule)
+            snapshot = storage._snapshot("rule")
+            if item_id(old) in snapshot or item_id(rule) not in snapshot: failures.add(f"replace not visible after replace_rule_entry returned: {old} -> {rule}")
+            live.append(rule)
+            counts["rule_replaces"] += 1
+        elif op < 0.85:
+            old = live.pop(rng.randrange(len(live)))
+            storage.remove_rule_entry(old)
+            if item_id(old) in storage._snapshot("rule"): failures.add(f"removed rule still visible after remove_rule_entry returned: {old}")
+            counts["rule_removes"] += 1
+        else:
+            m = next(synthetic_memories(1, seed=number, start=10 ** 9 + number * 10 ** 6 + n))
+            storage.add_memory_entry(m["user_input"], m["metrics"], m["bot_response"])
+            counts["memory_adds"] += 1
+    counts["live_rules"] = len(live)
+
+def _run_phase(storage, embedder, queries, args, writers: int, failures) -> dict:
+    stop = threading.Event()
+    read_latencies = [[] for _ in range(args.readers)]
+    samples, sample_slots = [], itertools.count()
+    write_counts = [{"rule_adds": 0, "rule_replaces": 0, "rule_removes": 0, "memory_adds": 0, "live_rules": 0} for _ in range(writers)]
+    threads = [threading.Thread(target=_reader, args=(storage, queries, args, stop, failures, read_latencies[r], samples, sample_slots), daemon=True)
+               for r in range(args.readers)]
+    threads += [threading.Thread(target=_writer, args=(storage, args.seed * 100 + w, stop, failures, write_counts[w]), daemon=True) for w in range(writers)]
+    started = time.perf_counter()
+    for t in threads: t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+
+    from ilearn_memory.retrieval import latency_summary
+    latencies = [l for per_thread in read_latencies for l in per_thread]
+    summary = latency_summary(latencies)
+    result = {"reads": len(latencies), "read_qps": round(len(latencies) / elapsed, 1),
+              "read_p50_ms": round(summary["p50_ms"], 3), "read_p99_ms": round(summary["p99_ms"], 3),
+              "exact_checks": _verify_samples(embedder, samples, args.k, failures)}
+    if writers:
+        totals = {key: sum(c[key] for c in write_counts) for key in write_counts[0]}
+        result.update(totals)
+        result["write_ops_per_s"] = round((totals["rule_adds"] + totals["rule_replaces"] + totals["rule_removes"] + totals["memory_adds"]) / elapsed, 1)
+    return result
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="ilearn-stress-")
+    try:
+        return _run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _run(args, workdir: str) -> dict:
+    os.environ.update({"STORAGE_BACKEND": args.backend, "SQLITE_DB_PATH": os.path.join(workdir, "stress.db"),
+                       "INDEX_SNAPSHOT_ENABLED": "false", "EMBEDDING_CACHE_ENABLED": "false",
+                       "QUERY_CACHE_SIZE": "0", "RESULT_CACHE_SIZE": "0"}) # Every read runs a real search
+    if args.factory != "Flat": os.environ.update({"FAISS_INDEX_FACTORY": args.factory, "FAISS_TRAIN_THRESHOLD": str(args.train_threshold)})
+    if args.nprobe is not None: os.environ["FAISS_NPROBE"] = str(args.nprobe)
+    from benchmarks.corpus import synthetic_memories, synthetic_rules, synthetic_queries
+    from benchmarks.stub_embedder import HashingEmbedder
+    from ilearn_memory import storage
+
+    embedder = HashingEmbedder(args.dimension)
+    storage.initialize_memory_system(embedder=embedder)
+    if not storage.wait_until_ready(): raise SystemExit("initialize_memory_system() failed; FAISS and numpy are required.")
+    seeded_rules = storage.add_rules_bulk(synthetic_rules(args.size, args.seed))
+    # Tombstone some rules of the base index, so merges during the run must remove vectors from it
+    for rule in itertools.islice(synthetic_rules(args.size, args.seed), 0, None, 50): storage.remove_rule_entry(rule)
+    seeded_rules = len(storage._snapshot("rule"))
+    seeded_memories = storage.add_memories_bulk(synthetic_memories(args.size, args.seed))
+    queries = synthetic_queries(500, args.seed)
+    if not _exact_search(storage): args.exact_checks = 0 # Approximate results would not match brute force
+
+    failures = _Failures()
+    idle = _run_phase(storage, embedder, queries, args, 0, failures)
+    busy = _run_phase(storage, embedder, queries, args, args.writers, failures)
+
+    # After the writers stop, the store must hold exactly what they left behind, in memory and in the backend
+    expected_rules = seeded_rules + busy.get("live_rules", 0)
+    rules_now = len(storage._snapshot("rule"))
+    if rules_now != expected_rules: failures.add(f"{rules_now} rules in the final snapshot, expected {expected_rules}")
+    memories_now, expected_memories = len(storage._snapshot("memory")), seeded_memories + busy.get("memory_adds", 0)
+    if memories_now != expected_memories: failures.add(f"{memories_now} memories in the final snapshot, expected {expected_memories}")
+    if storage._sqlite_store:
+        stored = len(storage._sqlite_store.load("rule"))
+        if stored != rules_now: failures.add(f"{stored} rules in SQLite but {rules_now} in the final snapshot")
+    self_checks = _check_self_lookups(storage, embedder, args.self_checks, failures)
+
+    return {"config": {"backend": args.backend, "size": args.size, "readers": args.readers, "writers": args.writers, "seconds": args.seconds,
+                       "k": args.k, "exact_checks": args.exact_checks, "factory": args.factory, "nprobe": args.nprobe},
+            "reads_only": idle, "reads_with_writes": busy, "self_checks": self_checks,
+            "read_qps_ratio": round(busy["read_qps"] / idle["read_qps"], 3) if idle["read_qps"] else None,
+            "failures": failures.count, "failure_samples": failures.samples}
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    result = run(args)
+    payload = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(payload + "\n")
+    print(payload)
+    return 1 if result["failures"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+import hashlib
+import numpy as np
+
+class HashingEmbedder:
+    """
+    Deterministic, offline stand-in for SentenceTransformer. Word tokens are hashed into a
+    fixed-size signed bag-of-words vector and L2-normalised, so similar texts land close together
+    and runs are reproducible without downloading a model or touching a GPU.
+    """
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self.model_name = f"stub-hashing-{dimension}"
+        self._buckets = {} # token -> (bucket, sign); synthetic corpora have a small vocabulary
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _bucket(self, token: str) -> tuple:
+        h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        self._buckets[token] = entry = (h % self.dimension, 1.0 if h >> 63 else -1.0)
+        return entry
+
+    def encode(self, texts, convert_to_numpy: bool = True, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.lower().split():
+                bucket, sign = self._buckets.get(token) or self._bucket(token)
+                vectors[row, bucket] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
@@ -0,0 +1,145 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions endpoint, for exercising the learning
+loop offline. It answers curator prompts (see learning.py) with a deterministic `<operations_list>`
+streamed as Server-Sent Events in small chunks, wrapped in a code fence like real models tend to,
+and records how many requests were in flight and when each started.
+
+  python -m benchmarks.stub_llm --port 8000 --latency-ms 50 --chunk-delay-ms 2
+  GROQ_API_KEY=stub GROQ_API_URL=http://127.0.0.1:8000/v1/chat/completions python your_script.py
+
+GET /stats returns the recorded counters as JSON.
+"""
+import re
+import sys
+import json
+import time
+import zlib
+import argparse
+import threading
+from xml.sax.saxutils import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_PROMPT = re.compile(r"Interaction Summary:\n(.*?)\n\nPotentially Relevant Existing Rules:\n(.*?)\n\nTask:", re.DOTALL)
+_RULE_PREFIX = re.compile(r"^\[([A-Za-z_]+)\|[\d.]+\]")
+
+def operations_for(interaction_summary: str, relevant_rules: list) -> list:
+    """
+    The operations the stub proposes for an interaction, as `generate_rule_updates` should parse
+    them: an 'add' derived from the summary and, when rules were supplied, an 'update' that
+    re-scores the first one. Every seventh interaction also gets an invalid operation, which the
+    parser must skip.
+    """
+    h = zlib.crc32(interaction_summary.encode("utf-8"))
+    words = " ".join(interaction_summary.split()[:8])
+    operations = [{"action": "add", "insight": f"[GENERAL_LEARNING|0.{h % 90 + 10}] For requests like '{words}', answer directly.", "old_insight_to_replace": None}]
+    if relevant_rules:
+        old = relevant_rules[0]
+        new = _RULE_PREFIX.sub(lambda m: f"[{m.group(1)}|0.{h % 7 + 90}]", old, count=1)
+        if new != old: operations.append({"action": "update", "insight": new, "old_insight_to_replace": old})
+    return operations
+
+def _invalid_operation(interaction_summary: str) -> list:
+    return [{"action": "add", "insight": "No type prefix, so not a rule"}] if zlib.crc32(interaction_summary.encode("utf-8")) % 7 == 0 else []
+
+def render_operations(operations: list) -> str:
+    parts = ["<operations_list>"]
+    for op in operations:
+        parts.append(f"<operation><action>{op['action']}</action><insight>{escape(op['insight'])}</insight>")
+        if op.get("old_insight_to_replace"): parts.append(f"<old_insight_to_replace>{escape(op['old_insight_to_replace'])}</old_insight_to_replace>")
+        parts.append("</operation>")
+    parts.append("</operations_list>")
+    return "```xml\n" + "\n".join(parts) + "\n```"
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests, self.in_flight, self.max_in_flight, self.starts = 0, 0, 0, []
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.starts.append(time.monotonic())
+
+    def finished(self):
+        with self._lock: self.in_flight -= 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            gaps = [b - a for a, b in zip(self.starts, self.starts[1:])]
+            return {"requests": self.requests, "in_flight": self.in_flight, "max_in_flight": self.max_in_flight,
+                    "min_start_gap_s": min(gaps) if gaps else None}
+
+def _make_handler(stats: _Stats, latency: float, chunk_delay: float, chunk_size: int):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # Keep-alive, like the providers the pooled client talks to
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/stats": return self._send_json(404, {"error": "not found"})
+            self._send_json(200, stats.to_dict())
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            stats.started()
+            try:
+                prompt = next((m["content"] for m in payload.get("messages", []) if m.get("role") == "user"), "")
+                match = _PROMPT.search(prompt)
+                if not match: return self._send_json(400, {"error": "not a curator prompt"})
+                summary, rules = match.group(1), json.loads(match.group(2))
+                text = render_operations(operations_for(summary, rules) + _invalid_operation(summary))
+                time.sleep(latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for start in range(0, len(text), chunk_size):
+                    delta = {"choices": [{"delta": {"content": text[start:start + chunk_size]}}]}
+                    self._write_chunk(f"data: {json.dumps(delta)}\n\n".encode("utf-8"))
+                    if chunk_delay: time.sleep(chunk_delay)
+                self._write_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+            finally:
+                stats.finished()
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+    return Handler
+
+def start(port: int = 0, latency_ms: float = 50, chunk_delay_ms: float = 2, chunk_size: int = 24) -> tuple:
+    """Serves in a background thread. Returns (server, stats, url of the chat completions endpoint)."""
+    stats = _Stats()
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(stats, latency_ms / 1000, chunk_delay_ms / 1000, chunk_size))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible LLM server for the learning loop.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Delay before the first token.")
+    parser.add_argument("--chunk-delay-ms", type=float, default=2, help="Delay between streamed chunks.")
+    parser.add_argument("--chunk-size", type=int, default=24, help="Characters per streamed chunk.")
+    args = parser.parse_args(argv)
+    server, _, url = start(args.port, args.latency_ms, args.chunk_delay_ms, args.chunk_size)
+    print(f"Stub LLM serving {url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,51 @@
 import logging
-from .storage import (
-    initialize_memory_system,
-    add_memory_entry,
-    retrieve_memories_semantic,
-    get_all_memories_cached,
-    clear_all_memory_data_backend,
-    add_rule_entry,
-    retrieve_rules_semantic,
-    remove_rule_entry,
-    get_all_rules_cached,
-    clear_all_rules_data_backend,
-    load_memories_from_file,
-    load_rules_from_file,
-)
-from .learning import generate_rule_updates
+import importlib
 
-# Configure a logger for the library
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# The library logs under "ilearn_memory" but leaves handler and level configuration to the application
 log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
 
 # Suppress overly verbose logs from third-party libraries
 for lib_name in ["urllib3", "huggingface_hub", "sentence_transformers", "faiss", "datasets"]:
     if logging.getLogger(lib_name):
         logging.getLogger(lib_name).setLevel(logging.WARNING)
 
+# Public names resolve lazily (PEP 562): importing the package loads nothing heavy, and a process
+# that only uses the LLM layer never imports numpy, FAISS or the embedding model.
+_STORAGE_EXPORTS = (
+    "initialize_memory_system", "wait_until_ready", "add_memory_entry", "retrieve_memories_semantic",
+    "get_all_memories_cached", "iter_memories", "clear_all_memory_data_backend", "add_rule_entry",
+    "retrieve_rules_semantic", "retrieve_semantic_batch", "remove_rule_entry", "replace_rule_entry",
+    "get_all_rules_cached", "clear_all_rules_data_backend", "load_memories_from_file", "load_rules_from_file",
+    "add_memories_bulk", "add_rules_bulk", "flush", "save_index_snapshots", "index_recall_report",
+    "get_retrieval_cache_stats", "clear_retrieval_caches", "apply_retention", "compact_memories",
+    "apply_rule_updates",
+)
+_LAZY_EXPORTS = {name: ".storage" for name in _STORAGE_EXPORTS}
+_LAZY_EXPORTS.update({"RetrievalCoalescer": ".retrieval", "compare_latency": ".retrieval", "generate_rule_updates": ".learning",
+                      "curate_rules_batch": ".learning"})
+_LAZY_SUBMODULES = ("metrics",)
+
+def __getattr__(name: str):
+    if name in _LAZY_SUBMODULES:
+        value = importlib.import_module(f".{name}", __name__)
+    elif name in _LAZY_EXPORTS:
+        value = getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value # Later lookups skip __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
 __all__ = [
-    "initialize_memory_system", "add_memory_entry", "retrieve_memories_semantic", 
-    "get_all_memories_cached", "clear_all_memory_data_backend", "add_rule_entry", 
-    "retrieve_rules_semantic", "remove_rule_entry", "get_all_rules_cached", 
+    "initialize_memory_system", "add_memory_entry", "retrieve_memories_semantic",
+    "get_all_memories_cached", "clear_all_memory_data_backend", "add_rule_entry",
+    "retrieve_rules_semantic", "remove_rule_entry", "replace_rule_entry", "get_all_rules_cached",
     "clear_all_rules_data_backend", "generate_rule_updates",
-    "load_memories_from_file", "load_rules_from_file"
+    "load_memories_from_file", "load_rules_from_file", "add_memories_bulk", "add_rules_bulk",
+    "flush", "save_index_snapshots", "retrieve_semantic_batch", "RetrievalCoalescer", "compare_latency",
+    "index_recall_report", "iter_memories", "get_retrieval_cache_stats", "clear_retrieval_caches", "metrics",
+    "wait_until_ready", "apply_retention", "compact_memories", "curate_rules_batch", "apply_rule_updates"
 ]
@@ -0,0 +1,106 @@
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+_SQL_BATCH = 500  # Stay well below SQLite's host-parameter limit
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed store of embedding vectors.
+    Keys are a hash of the model name, the vector dimension and the exact embedded text,
+    so changing the model or the text never serves a stale vector.
+    """
+    def __init__(self, path: str, model_name: str, dimension: int):
+        self.path, self.model_name, self.dimension = path, model_name, dimension
+        db_dir = os.path.dirname(path)
+        if db_dir: os.makedirs(db_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{self.dimension}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list) -> dict:
+        """Returns {key: vector} for every key present in the cache."""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), _SQL_BATCH):
+                chunk = unique_keys[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(chunk))
+                for key, blob in self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk):
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    if vector.shape[0] == self.dimension: found[key] = vector
+        return found
+
+    def put_many(self, entries: dict):
+        if not entries: return
+        rows = [(key, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in entries.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def discard(self, keys: list):
+        if not keys: return
+        with self._lock:
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(k,) for k in keys])
+            self._conn.commit()
+
+    def retain(self, live_keys) -> int:
+        """Garbage-collects every entry whose key is not in `live_keys`. Returns the number removed."""
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_keys (key TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM live_keys")
+            self._conn.executemany("INSERT OR IGNORE INTO live_keys (key) VALUES (?)", [(k,) for k in live_keys])
+            removed = self._conn.execute("DELETE FROM embeddings WHERE key NOT IN (SELECT key FROM live_keys)").rowcount
+            self._conn.execute("DELETE FROM live_keys")
+            self._conn.commit()
+        if removed: log.info(f"Embedding cache: garbage-collected {removed} stale entries.")
+        return removed
+
+class LRUCache:
+    """A thread-safe, bounded LRU cache with optional per-entry TTL and hit/miss counters."""
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize, self.ttl = maxsize, ttl or None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, default=None):
+        if self.maxsize <= 0: return default
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None: del self._data[key] # Expired
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0: return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
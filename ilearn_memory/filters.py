@@ -0,0 +1,101 @@
+"""
+Metadata filters for retrieval. Every base index gets attribute columns aligned with its ids (rule
+type and score; memory time, score and takeaway), built once and shared by all snapshots over that
+index. A filtered search turns the filter into the ids that match and hands them to FAISS as an ID
+selector, so only candidate vectors are scored instead of over-fetching and discarding.
+"""
+import os
+import re
+import math
+from datetime import datetime, timezone
+import numpy as np
+
+from . import retention
+
+# Filters matching at most this many indexed items score them exactly instead of searching with a selector,
+# which is faster for small sets and never comes up short on approximate indexes (IVF, HNSW)
+FILTER_EXACT_MAX = int(os.getenv("FILTER_EXACT_MAX", "2048"))
+
+RULE_PREFIX = re.compile(r"^\s*\[([A-Za-z_]+)\|([\d.]+)\]")
+_NO_TAKEAWAY = ("", "N/A")
+
+def rule_attributes(rule_text: str) -> dict:
+    """Type and score from a rule's `[TYPE|SCORE]` prefix; ("", NaN) if it has none."""
+    match = RULE_PREFIX.match(rule_text)
+    if not match: return {"type": "", "score": math.nan}
+    try:
+        return {"type": match.group(1).upper(), "score": float(match.group(2))}
+    except ValueError:
+        return {"type": match.group(1).upper(), "score": math.nan}
+
+def memory_attributes(record) -> dict:
+    """Timestamp (epoch seconds), score metric (see retention.MEMORY_SCORE_METRIC) and whether a takeaway was recorded."""
+    score = record.metric(retention.MEMORY_SCORE_METRIC)
+    takeaway = record.metric("takeaway")
+    return {"time": record.epoch if record.epoch is not None else math.nan,
+            "score": float(score) if isinstance(score, (int, float)) and not isinstance(score, bool) else math.nan,
+            "takeaway": isinstance(takeaway, str) and takeaway.strip() not in _NO_TAKEAWAY}
+
+def to_epoch(value) -> float | None:
+    """Accepts epoch seconds, a datetime or an ISO-8601 string (naive values are UTC, like stored timestamps)."""
+    if value is None or isinstance(value, (int, float)): return value
+    if isinstance(value, str): value = datetime.fromisoformat(value)
+    if isinstance(value, datetime): return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+    raise TypeError(f"Cannot interpret {value!r} as a time.")
+
+class Filter:
+    """
+    Conditions on item attributes, all of which must hold: `types` (rule types), `min_score`,
+    `since` (inclusive) and `until` (exclusive), and `has_takeaway`. Items missing an attribute
+    a condition needs do not match it.
+    """
+    __slots__ = ("types", "min_score", "since", "until", "has_takeaway")
+
+    def __init__(self, types=None, min_score: float = None, since=None, until=None, has_takeaway: bool = None):
+        if isinstance(types, str): types = [types]
+        self.types = frozenset(t.upper() for t in types) if types is not None else None
+        self.min_score = min_score
+        self.since, self.until = to_epoch(since), to_epoch(until)
+        self.has_takeaway = has_takeaway
+
+    def __bool__(self) -> bool:
+        return any(v is not None for v in self.key)
+
+    @property
+    def key(self) -> tuple:
+        """Hashable form, for result-cache keys."""
+        return (tuple(sorted(self.types)) if self.types is not None else None, self.min_score, self.since, self.until, self.has_takeaway)
+
+    def mask(self, columns: dict, size: int) -> np.ndarray:
+        """Boolean mask over attribute columns (see Columns)."""
+        mask = np.ones(size, dtype=bool)
+        if self.types is not None: mask &= np.isin(columns["type"], list(self.types))
+        if self.min_score is not None: mask &= columns["score"] >= self.min_score # NaN never matches
+        if self.since is not None: mask &= columns["time"] >= self.since
+        if self.until is not None: mask &= columns["time"] < self.until
+        if self.has_takeaway is not None: mask &= columns["takeaway"] == bool(self.has_takeaway)
+        return mask
+
+    def matches(self, attributes: dict) -> bool:
+        """The same test for a single item's attributes."""
+        if self.types is not None and attributes["type"] not in self.types: return False
+        if self.min_score is not None and not attributes["score"] >= self.min_score: return False
+        if self.since is not None and not attributes["time"] >= self.since: return False
+        if self.until is not None and not attributes["time"] < self.until: return False
+        if self.has_takeaway is not None and attributes["takeaway"] != bool(self.has_takeaway): return False
+        return True
+
+class Columns:
+    """Attribute columns for the items of one base index, aligned with `ids`."""
+    def __init__(self, items: dict, attributes):
+        rows = [attributes(item) for item in items.values()]
+        self.ids = np.fromiter(items, dtype=np.int64, count=len(items))
+        self.columns = {name: np.array([row[name] for row in rows]) for name in (rows[0] if rows else ())}
+
+    def select(self, where: Filter) -> np.ndarray:
+        """Ids of the items that match `where`."""
+        if not len(self.ids): return self.ids
+        try:
+            return self.ids[where.mask(self.columns, len(self.ids))]
+        except KeyError as e:
+            raise ValueError(f"Filter on {e.args[0]!r} does not apply to this store.") from None
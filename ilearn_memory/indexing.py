@@ -0,0 +1,176 @@
+import os
+import time
+import hashlib
+import logging
+import numpy as np
+
+from .lazy import LazyModule
+
+faiss = LazyModule("faiss", "faiss-cpu") # Imported on first use
+
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Any FAISS factory string, e.g. "Flat", "HNSW32", "IVF1024,Flat" or "IVF1024,PQ16"
+INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", "Flat")
+# Below this many vectors an exact Flat index is used; at or above it the factory index is trained
+INDEX_TRAIN_THRESHOLD = int(os.getenv("FAISS_TRAIN_THRESHOLD", "10000"))
+INDEX_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))
+INDEX_NPROBE = os.getenv("FAISS_NPROBE")
+INDEX_EF_SEARCH = os.getenv("FAISS_EF_SEARCH")
+
+def item_id(text: str) -> int:
+    """Stable 63-bit id for an item, derived from its exact stored text."""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+def new_index(dimension: int):
+    """Creates an empty ID-mapped index, so vectors are addressed by item id instead of position."""
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+def is_flat(index) -> bool:
+    return isinstance(faiss.downcast_index(index.index), faiss.IndexFlat)
+
+def index_kind(index) -> str:
+    """The factory string the index was built from ("Flat" for the exact fallback)."""
+    return "Flat" if is_flat(index) else INDEX_FACTORY
+
+def apply_search_params(index, nprobe=None, ef_search=None):
+    """Applies the configured search-time knobs (nprobe for IVF, efSearch for HNSW) where they apply."""
+    nprobe = nprobe if nprobe is not None else INDEX_NPROBE
+    ef_search = ef_search if ef_search is not None else INDEX_EF_SEARCH
+    if is_flat(index): return
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None: continue
+        try:
+            params.set_index_parameter(index, name, int(value))
+        except RuntimeError:
+            pass # Not applicable to this index type
+
+def can_reconstruct(index) -> bool:
+    """Whether vectors can be read back by id without modifying the index (IVF only with its direct map, see keep_direct_map)."""
+    inner = faiss.downcast_index(index.index)
+    if is_flat(index) or isinstance(inner, faiss.IndexHNSW): return True
+    ivf = faiss.try_extract_index_ivf(inner)
+    return ivf is not None and ivf.direct_map.type != faiss.DirectMap.NoMap
+
+def selector_params(index, ids: np.ndarray) -> tuple:
+    """
+    Search parameters that restrict a search of `index` to the vectors with the given item ids,
+    keeping its efSearch. IVF probes more lists the more selective the filter, in proportion to
+    the share of vectors it excludes, up to every list; each probed list then holds about as many
+    candidates as an unfiltered search would score. Returns (params, selector); hold on to both for
+    the duration of the search, since the parameters do not own the selector. Build new ones per
+    search: FAISS swaps the selector inside the parameters while searching an ID-mapped index.
+    """
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
+    inner = faiss.downcast_index(index.index)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        nprobe = min(ivf.nlist, -(-ivf.nprobe * index.ntotal // max(1, len(ids))))
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=max(ivf.nprobe, nprobe))
+    elif isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return params, selector
+
+def build_index(dimension: int, vectors: np.ndarray, ids: list, factory: str = None, train_threshold: int = None):
+    """
+    Builds an ID-mapped index over `vectors`. Uses the configured factory index (trained on up to
+    FAISS_TRAIN_SAMPLE vectors) once there are FAISS_TRAIN_THRESHOLD vectors, and Flat below that.
+    """
+    factory = factory or INDEX_FACTORY
+    train_threshold = INDEX_TRAIN_THRESHOLD if train_threshold is None else train_threshold
+    if factory == "Flat" or len(ids) < train_threshold:
+        index = new_index(dimension)
+    else:
+        started = time.perf_counter()
+        index = faiss.index_factory(dimension, f"IDMap2,{factory}")
+        if not index.is_trained:
+            sample = vectors
+            if len(vectors) > INDEX_TRAIN_SAMPLE:
+                sample = vectors[np.random.default_rng(0).choice(len(vectors), INDEX_TRAIN_SAMPLE, replace=False)]
+            index.train(np.ascontiguousarray(sample, dtype=np.float32))
+        log.info(f"Trained '{factory}' index on {min(len(vectors), INDEX_TRAIN_SAMPLE)} vectors in {time.perf_counter() - started:.2f}s.")
+        apply_search_params(index)
+        keep_direct_map(index)
+    add_with_ids(index, vectors, ids)
+    return index
+
+def keep_direct_map(index):
+    """
+    Gives an IVF index a direct map, which later adds keep up to date, so its vectors can be read
+    back. Raises RuntimeError if the index has already lost its sequential layout.
+    """
+    ivf = faiss.try_extract_index_ivf(index.index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap: ivf.make_direct_map()
+
+def indexed_ids(index) -> np.ndarray:
+    return faiss.vector_to_array(index.id_map).astype(np.int64) if index.ntotal else np.zeros(0, dtype=np.int64)
+
+def all_vectors(index) -> tuple:
+    """Returns (ids, vectors) for everything in the index (approximate for compressed indices like PQ)."""
+    ids = indexed_ids(index)
+    if not len(ids): return ids, np.zeros((0, index.d), dtype=np.float32)
+    keep_direct_map(index)
+    return ids, index.index.reconstruct_n(0, index.ntotal)
+
+def add_with_ids(index, vectors: np.ndarray, ids: list):
+    if len(ids): index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), np.asarray(ids, dtype=np.int64))
+
+def remove_ids(index, ids: list):
+    """
+    Removes vectors by id and returns the index to use from now on. Only Flat removes in place:
+    IndexIDMap2 expects the inner index to renumber its vectors after a removal, which IVF does not
+    and HNSW cannot, so other index types are refilled from their stored vectors (approximate for
+    PQ) without retraining.
+    """
+    if not len(ids): return index
+    if is_flat(index):
+        index.remove_ids(np.asarray(ids, dtype=np.int64))
+        return index
+    all_ids, vectors = all_vectors(index)
+    keep = ~np.isin(all_ids, np.asarray(ids, dtype=np.int64))
+    inner = faiss.clone_index(index.index) # Keeps the trained coarse quantizer and codebooks, and the search parameters
+    inner.reset()
+    rebuilt = faiss.IndexIDMap2(inner)
+    keep_direct_map(rebuilt)
+    add_with_ids(rebuilt, vectors[keep], all_ids[keep])
+    return rebuilt
+
+def maybe_upgrade(index):
+    """Swaps a Flat index for the configured factory index once it has grown past the training threshold."""
+    if INDEX_FACTORY == "Flat" or index.ntotal < INDEX_TRAIN_THRESHOLD or not is_flat(index): return index
+    log.info(f"Index reached {index.ntotal} vectors; switching from Flat to '{INDEX_FACTORY}'.")
+    ids, vectors = all_vectors(index)
+    return build_index(index.d, vectors, ids.tolist())
+
+def recall_report(index, queries: np.ndarray, k: int = 10, label: str = None) -> dict:
+    """
+    Compares `index` against an exact Flat search over the same vectors for `queries`.
+    Returns recall@k and per-query latency percentiles for both.
+    """
+    ids, vectors = all_vectors(index)
+    exact = faiss.IndexFlatL2(index.d)
+    exact.add(vectors)
+    k = min(k, index.ntotal)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    def timed_search(search_index, translate):
+        latencies, results = [], []
+        for q in queries:
+            started = time.perf_counter()
+            _, found = search_index.search(q[None, :], k)
+            latencies.append(time.perf_counter() - started)
+            results.append(set(translate(found[0])))
+        latencies.sort()
+        return results, latencies
+
+    ann_results, ann_latencies = timed_search(index, lambda row: row[row >= 0].tolist())
+    exact_results, exact_latencies = timed_search(exact, lambda row: ids[row[row >= 0]].tolist())
+    recall = sum(len(a & e) for a, e in zip(ann_results, exact_results)) / max(1, k * len(queries))
+    pct = lambda values, p: values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000 if values else 0.0
+    return {"index": label or index_kind(index), "ntotal": index.ntotal, "k": k, "queries": len(queries), f"recall@{k}": recall,
+            "ann_p50_ms": pct(ann_latencies, 50), "ann_p99_ms": pct(ann_latencies, 99),
+            "exact_p50_ms": pct(exact_latencies, 50), "exact_p99_ms": pct(exact_latencies, 99)}
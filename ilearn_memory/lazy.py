@@ -0,0 +1,38 @@
+import importlib
+import importlib.util
+
+class LazyModule:
+    """
+    Stands in for an optional heavy dependency (faiss, sentence_transformers, datasets, httpx) and
+    imports it on first attribute access, so importing ilearn_memory never pays for it up front.
+    Truthiness reports whether the module is installed without importing it.
+    """
+    def __init__(self, name: str, pip_name: str = None):
+        self._name, self._pip_name = name, pip_name or name
+        self._module = None
+        self._available = None
+
+    def _load(self):
+        if self._module is None:
+            try:
+                self._module = importlib.import_module(self._name)
+            except ImportError as e:
+                self._available = False
+                raise ImportError(f"{self._name} is required for this feature. Install it with `pip install {self._pip_name}`.") from e
+            self._available = True
+        return self._module
+
+    def __getattr__(self, attr: str):
+        if attr.startswith("__"): raise AttributeError(attr) # Keep copy/pickle/inspect probes from importing
+        return getattr(self._load(), attr)
+
+    def __bool__(self) -> bool:
+        if self._available is None:
+            try:
+                self._available = importlib.util.find_spec(self._name) is not None
+            except (ImportError, ValueError):
+                self._available = False
+        return self._available
+
+    def __repr__(self) -> str:
+        return f"<LazyModule {self._name!r} ({'loaded' if self._module is not None else 'not loaded'})>"
@@ -1,14 +1,46 @@
 import os
 import re
 import json
+import time
+import asyncio
 import logging
 import xml.etree.ElementTree as ET
 from typing import List, Dict
 
-from .llm import call_model_stream, MODELS_BY_PROVIDER
+from . import metrics
+from .llm import call_model_stream, get_models_by_provider, load_env
 
 log = logging.getLogger(__name__)
 
+# Interactions curate_rules_batch() works on at once; the per-provider limits in transport.py apply on top
+LEARNING_BATCH_CONCURRENCY = int(os.getenv("LEARNING_BATCH_CONCURRENCY", "8"))
+
+_INSIGHT_PREFIX = re.compile(r"\[(CORE_RULE|RESPONSE_PRINCIPLE|BEHAVIORAL_ADJUSTMENT|GENERAL_LEARNING)\|[\d\.]+\]", re.I)
+_LIST_START = re.compile(r"<operations_list\b", re.I)
+
+_INSIGHT_SYS_PROMPT = """You are an expert AI knowledge base curator. Your task is to analyze an interaction and output a valid XML structure to update the AI's guiding principles (rules).
+The root element must be `<operations_list>`. Each operation is an `<operation>` with child elements: `<action>` (either "add" or "update"), `<insight>` (the new/updated rule text, including its `[TYPE|SCORE]` prefix), and an optional `<old_insight_to_replace>` for "update" actions.
+If no changes are needed, output an empty list: `<operations_list></operations_list>`.
+**CRITICAL**: Output ONLY the XML structure. No explanations or other text."""
+
+def _curator_messages(interaction_summary: str, relevant_rules: List[str]) -> List[Dict]:
+    insight_user_prompt = f"Interaction Summary:\n{interaction_summary}\n\nPotentially Relevant Existing Rules:\n{json.dumps(relevant_rules)}\n\nTask: Based on the interaction, generate XML operations to add, update, or consolidate rules to improve the AI's future performance."
+    return [{"role": "system", "content": _INSIGHT_SYS_PROMPT}, {"role": "user", "content": insight_user_prompt}]
+
+def _curator_model(provider: str, model_display_name: str, api_key: str = None) -> tuple:
+    """Applies INSIGHT_MODEL_OVERRIDE ("provider/model_id"), which allows a more powerful "teacher" model."""
+    load_env()
+    curator_override = os.getenv("INSIGHT_MODEL_OVERRIDE")
+    if curator_override and "/" in curator_override:
+        p, m_id = curator_override.split('/', 1)
+        models_dict = get_models_by_provider().get(p.lower(), {}).get("models", {})
+        m_disp = next((dn for dn, mid in models_dict.items() if mid == m_id), None)
+        if m_disp:
+            provider, model_display_name = p, m_disp
+            api_key = os.getenv(f"{p.upper()}_API_KEY", api_key)
+            log.info(f"Using Insight Model Override: {provider}/{model_display_name}")
+    return provider, model_display_name, api_key
+
 async def generate_rule_updates(
     interaction_summary: str,
     relevant_rules: List[str],
@@ -23,68 +55,166 @@ async def generate_rule_updates(
     [{'action': 'update', 'insight': '...', 'old_insight_to_replace': '...'}]
     """
     log.info("Generating rule updates based on interaction...")
-    
-    insight_sys_prompt = """You are an expert AI knowledge base curator. Your task is to analyze an interaction and output a valid XML structure to update the AI's guiding principles (rules).
-The root element must be `<operations_list>`. Each operation is an `<operation>` with child elements: `<action>` (either "add" or "update"), `<insight>` (the new/updated rule text, including its `[TYPE|SCORE]` prefix), and an optional `<old_insight_to_replace>` for "update" actions.
-If no changes are needed, output an empty list: `<operations_list></operations_list>`.
-**CRITICAL**: Output ONLY the XML structure. No explanations or other text."""
-    
-    insight_user_prompt = f"Interaction Summary:\n{interaction_summary}\n\nPotentially Relevant Existing Rules:\n{json.dumps(relevant_rules)}\n\nTask: Based on the interaction, generate XML operations to add, update, or consolidate rules to improve the AI's future performance."
+    provider, model_display_name, api_key = _curator_model(provider, model_display_name, api_key)
+    operations, _ = await _curate(interaction_summary, relevant_rules, provider, model_display_name, api_key)
+    return operations
 
-    # Allow override for a more powerful "teacher" model
-    curator_override = os.getenv("INSIGHT_MODEL_OVERRIDE")
-    if curator_override and "/" in curator_override:
-        p, m_id = curator_override.split('/', 1)
-        models_dict = MODELS_BY_PROVIDER.get(p.lower(), {}).get("models", {})
-        m_disp = next((dn for dn, mid in models_dict.items() if mid == m_id), None)
-        if m_disp:
-            provider, model_display_name = p, m_disp
-            api_key = os.getenv(f"{p.upper()}_API_KEY", api_key)
-            log.info(f"Using Insight Model Override: {provider}/{model_display_name}")
+async def _curate(interaction_summary: str, relevant_rules: List[str], provider: str, model_display_name: str, api_key: str) -> tuple:
+    """
+    One curator call. Operations are parsed as the response streams in, so each is ready as soon
+    as its closing tag arrives. Returns (operations, ok); `ok` is False when the call failed or
+    the response held no `<operations_list>`.
+    """
+    started = time.perf_counter()
+    messages = _curator_messages(interaction_summary, relevant_rules)
+    metrics.observe("ilearn_learning_stage_seconds", time.perf_counter() - started, stage="prompt_build")
 
-    messages = [{"role": "system", "content": insight_sys_prompt}, {"role": "user", "content": insight_user_prompt}]
-    
-    xml_response = ""
+    parser, operations, parse_seconds = OperationStreamParser(), [], 0.0
     try:
-        async for chunk in call_model_stream(provider, model_display_name, messages, api_key, temperature=0.0, max_tokens=2000):
-            xml_response += chunk
+        with metrics.timed("ilearn_learning_stage_seconds", stage="stream"):
+            async for chunk in call_model_stream(provider, model_display_name, messages, api_key, temperature=0.0, max_tokens=2000):
+                parse_started = time.perf_counter()
+                operations += parser.feed(chunk)
+                parse_seconds += time.perf_counter() - parse_started
     except Exception as e:
         log.error(f"Rule generation LLM call failed: {e}")
-        return []
+        return [], False
+
+    parse_started = time.perf_counter()
+    operations += parser.close()
+    metrics.observe("ilearn_learning_stage_seconds", parse_seconds + time.perf_counter() - parse_started, stage="xml_parse")
+    if not parser.found: log.warning(f"No <operations_list> found in LLM output. Raw: {parser.unparsed}")
+    metrics.observe("ilearn_learning_seconds", time.perf_counter() - started)
+    metrics.inc("ilearn_learning_operations_total", len(operations))
+    log.info(f"Parsed {len(operations)} rule operations from LLM.")
+    return operations, parser.found
+
+async def curate_rules_batch(
+    interactions,
+    provider: str,
+    model_display_name: str,
+    api_key: str = None,
+    concurrency: int = None,
+    rules_k: int = 5,
+    apply: bool = True
+) -> Dict:
+    """
+    Runs the reflective learning loop over many interactions, e.g. a nightly backfill of logged
+    ones. Each interaction is a summary string, or a dict with `interaction_summary` and optionally
+    `relevant_rules`; missing rules are retrieved for all summaries in one batched search (top
+    `rules_k`). Up to `concurrency` (LEARNING_BATCH_CONCURRENCY) curator calls run at once, within
+    the provider's LLM_MAX_CONCURRENCY and LLM_RATE_LIMITS. With `apply`, all resulting operations
+    are then applied in input order by a single `apply_rule_updates` call.
+
+    Returns {"operations": [list per interaction], "failed": [positions of failed interactions],
+    "applied": {"added": n, "removed": n} or None}.
+    """
+    started = time.perf_counter()
+    items = [{"interaction_summary": i} if isinstance(i, str) else i for i in interactions]
+    relevant = {n: item["relevant_rules"] for n, item in enumerate(items) if item.get("relevant_rules") is not None}
+    missing = [n for n in range(len(items)) if n not in relevant]
+    if missing and rules_k > 0:
+        from . import storage # Imported here so the single-interaction path needs only the LLM layer
+        found = await asyncio.to_thread(storage.retrieve_semantic_batch, [items[n]["interaction_summary"] for n in missing], 0, rules_k)
+        relevant.update((n, r["rules"]) for n, r in zip(missing, found))
 
-    return _parse_rule_update_xml(xml_response)
+    provider, model_display_name, api_key = _curator_model(provider, model_display_name, api_key)
+    results, failed = [[] for _ in items], []
+    positions = iter(range(len(items))) # Shared by the workers, so at most `concurrency` calls are ever in flight
+
+    async def worker():
+        for n in positions:
+            results[n], ok = await _curate(items[n]["interaction_summary"], relevant.get(n, []), provider, model_display_name, api_key)
+            if not ok: failed.append(n)
+
+    await asyncio.gather(*(worker() for _ in range(min(max(1, concurrency or LEARNING_BATCH_CONCURRENCY), len(items)))))
+    failed.sort()
+    total = sum(len(ops) for ops in results)
+    log.info(f"Curated {len(items)} interactions ({len(failed)} failed) into {total} rule operations in {time.perf_counter() - started:.2f}s.")
+
+    applied = None
+    if apply:
+        from . import storage
+        with metrics.timed("ilearn_learning_stage_seconds", stage="apply"):
+            applied = await asyncio.to_thread(storage.apply_rule_updates, [op for ops in results for op in ops])
+    return {"operations": results, "failed": failed, "applied": applied}
+
+def _operation_from_element(op_element) -> Dict | None:
+    """The operation described by an `<operation>` element, or None if it is invalid."""
+    action_el = op_element.find("action")
+    insight_el = op_element.find("insight")
+    old_insight_el = op_element.find("old_insight_to_replace")
+
+    action = action_el.text.strip().lower() if action_el is not None and action_el.text else None
+    insight = insight_el.text.strip() if insight_el is not None and insight_el.text else None
+    old_insight = old_insight_el.text.strip() if old_insight_el is not None and old_insight_el.text else None
+
+    # Validate the structure before returning
+    if action and insight and _INSIGHT_PREFIX.match(insight):
+        return {"action": action, "insight": insight, "old_insight_to_replace": old_insight}
+    log.warning(f"Skipped invalid operation from XML. Action: '{action}', Insight: '{insight}'")
+    return None
+
+class OperationStreamParser:
+    """
+    Incremental parser for the curator's XML. Feed it text chunks as they stream in; it returns
+    each valid `<operation>` as soon as its closing tag has arrived. Text before `<operations_list>`
+    (preambles, code fences) and after `</operations_list>` is ignored, and a malformed or
+    truncated response keeps the operations completed before the damage.
+    """
+    def __init__(self):
+        self.unparsed = "" # Text received before <operations_list>
+        self.found = False
+        self.done = False
+        self._parser = None
+
+    def feed(self, text: str) -> List[Dict]:
+        if self.done: return []
+        if self._parser is None:
+            scan_from = max(0, len(self.unparsed) - len("<operations_list")) # The tag may straddle chunks
+            self.unparsed += text
+            match = _LIST_START.search(self.unparsed, scan_from)
+            if not match: return []
+            text, self.unparsed = self.unparsed[match.start():], self.unparsed[:match.start()]
+            self._parser, self.found = ET.XMLPullParser(events=("end",)), True
+        try:
+            self._parser.feed(text)
+        except ET.ParseError as e:
+            return self._collect(error=e)
+        return self._collect()
+
+    def close(self) -> List[Dict]:
+        """Ends the stream and returns any operations still pending."""
+        if self._parser is None or self.done: return []
+        try:
+            self._parser.close()
+        except ET.ParseError as e:
+            return self._collect(error=e)
+        return self._collect()
+
+    def _collect(self, error: ET.ParseError = None) -> List[Dict]:
+        operations = []
+        try:
+            for _, element in self._parser.read_events():
+                tag = element.tag.lower()
+                if tag == "operation":
+                    operation = _operation_from_element(element)
+                    if operation: operations.append(operation)
+                    element.clear()
+                elif tag == "operations_list":
+                    self.done = True # Anything after the closing tag is not ours to parse
+                    break
+        except ET.ParseError as e:
+            error = error or e
+        if error is not None and not self.done:
+            self.done = True
+            log.error(f"XML parsing error in learning loop: {error}. Keeping the operations parsed before it.")
+        return operations
 
 def _parse_rule_update_xml(xml_string: str) -> List[Dict]:
     """Parses the XML output from the LLM into a list of operation dictionaries."""
-    operations = []
-    try:
-        # Clean the input to find the XML block
-        xml_match = re.search(r'<operations_list>.*</operations_list>', xml_string, re.DOTALL | re.IGNORECASE)
-        if not xml_match:
-            log.warning(f"No <operations_list> found in LLM output. Raw: {xml_string}")
-            return []
-            
-        root = ET.fromstring(xml_match.group(0))
-        for op_element in root.findall("operation"):
-            action_el = op_element.find("action")
-            insight_el = op_element.find("insight")
-            old_insight_el = op_element.find("old_insight_to_replace")
-            
-            action = action_el.text.strip().lower() if action_el is not None and action_el.text else None
-            insight = insight_el.text.strip() if insight_el is not None and insight_el.text else None
-            old_insight = old_insight_el.text.strip() if old_insight_el is not None and old_insight_el.text else None
-
-            # Validate the structure before appending
-            if action and insight and re.match(r"\[(CORE_RULE|RESPONSE_PRINCIPLE|BEHAVIORAL_ADJUSTMENT|GENERAL_LEARNING)\|[\d\.]+\]", insight, re.I):
-                operations.append({
-                    "action": action,
-                    "insight": insight,
-                    "old_insight_to_replace": old_insight
-                })
-            else:
-                log.warning(f"Skipped invalid operation from XML. Action: '{action}', Insight: '{insight}'")
-    except ET.ParseError as e:
-        log.error(f"XML parsing error in learning loop: {e}. XML content that failed:\n{xml_string}")
-    
+    parser = OperationStreamParser()
+    operations = parser.feed(xml_string) + parser.close()
+    if not parser.found: log.warning(f"No <operations_list> found in LLM output. Raw: {xml_string}")
     log.info(f"Parsed {len(operations)} rule operations from LLM.")
     return operations
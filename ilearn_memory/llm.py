@@ -1,48 +1,103 @@
 import os
-import requests
 import json
+import time
 import logging
-from dotenv import load_dotenv
+import threading
 
-load_dotenv()
-log = logging.getLogger(__name__)
+from . import metrics
+from .transport import stream_post, SSEParser, JSONStreamParser, TransportHTTPError
 
-# Load model data from the JSON file within the package
-try:
-    _models_file_path = os.path.join(os.path.dirname(__file__), 'models.json')
-    with open(_models_file_path, 'r') as f:
-        MODELS_BY_PROVIDER = json.load(f)
-except Exception:
-    log.error("models.json not found or failed to load. The package might be improperly installed.")
-    MODELS_BY_PROVIDER = {}
+log = logging.getLogger(__name__)
 
 API_KEYS_ENV_VARS = {
   "GROQ": 'GROQ_API_KEY', "OPENROUTER": 'OPENROUTER_API_KEY',
   "OPENAI": 'OPENAI_API_KEY', "GOOGLE": 'GOOGLE_API_KEY', "COHERE": 'COHERE_API_KEY',
 }
 
-API_URLS = {
+_DEFAULT_API_URLS = {
   "GROQ": 'https://api.groq.com/openai/v1/chat/completions',
   "OPENROUTER": 'https://openrouter.ai/api/v1/chat/completions',
   "OPENAI": 'https://api.openai.com/v1/chat/completions',
   "GOOGLE": 'https://generativelanguage.googleapis.com/v1beta/models/',
 }
 
+# The .env file, models.json and the provider URLs are loaded on first use rather than at import
+_load_lock = threading.Lock()
+_env_loaded = False
+_models_by_provider, _api_urls = None, None
+
+def load_env():
+    """Loads the .env file into the environment once (API keys, <PROVIDER>_API_URL overrides, INSIGHT_MODEL_OVERRIDE)."""
+    global _env_loaded
+    if _env_loaded: return
+    with _load_lock:
+        if _env_loaded: return
+        try:
+            from dotenv import load_dotenv
+            load_dotenv()
+        except ImportError:
+            log.debug("python-dotenv not installed; reading configuration from the environment only.")
+        _env_loaded = True
+
+def get_models_by_provider() -> dict:
+    """The provider -> {"models": {display name: model id}} mapping from models.json."""
+    global _models_by_provider
+    if _models_by_provider is None:
+        try:
+            with open(os.path.join(os.path.dirname(__file__), 'models.json'), 'r') as f:
+                _models_by_provider = json.load(f)
+        except Exception:
+            log.error("models.json not found or failed to load. The package might be improperly installed.")
+            _models_by_provider = {}
+    return _models_by_provider
+
+def get_api_urls() -> dict:
+    """Provider endpoints; each can be overridden with a <PROVIDER>_API_URL environment variable (or .env entry)."""
+    global _api_urls
+    if _api_urls is None:
+        load_env()
+        _api_urls = {name: os.getenv(f"{name}_API_URL", url) for name, url in _DEFAULT_API_URLS.items()}
+    return _api_urls
+
+def __getattr__(name: str):
+    # MODELS_BY_PROVIDER and API_URLS used to be built at import; keep them readable as module attributes
+    if name == "MODELS_BY_PROVIDER": return get_models_by_provider()
+    if name == "API_URLS": return get_api_urls()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def _get_api_key(provider: str, api_key_override: str = None) -> str | None:
     provider_upper = provider.upper()
     if api_key_override: return api_key_override
+    load_env()
     env_var_name = API_KEYS_ENV_VARS.get(provider_upper)
     return os.getenv(env_var_name) if env_var_name else None
 
-async def call_model_stream(provider: str, model_display_name: str, messages: list[dict], api_key_override: str = None, temperature: float = 0.7, max_tokens: int = 2048):
+def _openai_delta(data_json: str) -> str | None:
+    if data_json.strip() == '[DONE]': return None
+    try:
+        data = json.loads(data_json)
+    except json.JSONDecodeError:
+        log.warning(f"Skipping malformed stream event: {data_json[:200]}")
+        return None
+    if data.get("choices") and data["choices"][0].get("delta", {}).get("content"):
+        return data["choices"][0]["delta"]["content"]
+    return None
+
+def _google_delta(data: dict) -> str | None:
+    if data.get("candidates") and data["candidates"][0].get("content", {}).get("parts"):
+        return data["candidates"][0]["content"]["parts"][0].get("text")
+    return None
+
+async def call_model_stream(provider: str, model_display_name: str, messages: list[dict], api_key_override: str = None, temperature: float = 0.7, max_tokens: int = 2048, timeout: float = None):
     """
     Calls the specified model via its provider and streams the response.
-    Yields chunks of the response text.
+    Yields chunks of the response text. The request runs on a pooled async client, so it never
+    blocks the event loop; `timeout` overrides LLM_READ_TIMEOUT for this call.
     """
     provider_lower = provider.lower()
     api_key = _get_api_key(provider_lower, api_key_override)
-    base_url = API_URLS.get(provider.upper())
-    models_dict = MODELS_BY_PROVIDER.get(provider_lower, {}).get("models", {})
+    base_url = get_api_urls().get(provider.upper())
+    models_dict = get_models_by_provider().get(provider_lower, {}).get("models", {})
     model_id = models_dict.get(model_display_name)
 
     if not api_key:
@@ -68,33 +123,31 @@ async def call_model_stream(provider: str, model_display_name: str, messages: li
         yield f"[Error: Provider '{provider}' not yet supported in this handler.]"
         return
 
+    openai_compatible = provider_lower in ["groq", "openrouter", "openai"]
+    parser = SSEParser() if openai_compatible else JSONStreamParser()
+    started, first_token = time.perf_counter(), True
     try:
-        response = requests.post(request_url, headers=headers, json=payload, stream=True, timeout=180)
-        response.raise_for_status()
-
-        for chunk in response.iter_content(chunk_size=None):
-            decoded_chunk = chunk.decode('utf-8', errors='replace')
-            if provider_lower in ["groq", "openrouter", "openai"]:
-                for line in decoded_chunk.splitlines():
-                    if line.startswith('data: '):
-                        data_json = line[len('data: '):].strip()
-                        if data_json == '[DONE]': continue
-                        try:
-                            data = json.loads(data_json)
-                            if data.get("choices") and data["choices"][0].get("delta", {}).get("content"):
-                                yield data["choices"][0]["delta"]["content"]
-                        except json.JSONDecodeError: continue
-            elif provider_lower == "google":
-                try:
-                    data = json.loads(decoded_chunk)
-                    if data.get("candidates") and data["candidates"][0].get("content", {}).get("parts"):
-                        yield data["candidates"][0]["content"]["parts"][0]["text"]
-                except json.JSONDecodeError: continue
-
-    except requests.exceptions.HTTPError as e:
-        err_text = e.response.text[:200]
-        log.error(f"API HTTP Error ({e.response.status_code}) for {provider}: {err_text}")
-        yield f"[Error: API returned {e.response.status_code}.]"
+        async for raw_chunk in stream_post(provider_lower, request_url, headers, payload, timeout=timeout):
+            for event in parser.feed(raw_chunk):
+                text = _openai_delta(event) if openai_compatible else _google_delta(event)
+                if text:
+                    if first_token:
+                        metrics.observe("ilearn_llm_time_to_first_token_seconds", time.perf_counter() - started, provider=provider_lower)
+                        first_token = False
+                    metrics.inc("ilearn_llm_chunks_total", provider=provider_lower)
+                    yield text
+        if openai_compatible:
+            for event in parser.close():
+                text = _openai_delta(event)
+                if text: yield text
+
+    except TransportHTTPError as e:
+        metrics.inc("ilearn_llm_errors_total", provider=provider_lower, kind=f"http_{e.status_code}")
+        log.error(f"API HTTP Error ({e.status_code}) for {provider}: {e.text}")
+        yield f"[Error: API returned {e.status_code}.]"
     except Exception as e:
+        metrics.inc("ilearn_llm_errors_total", provider=provider_lower, kind=type(e).__name__)
         log.error(f"Unexpected error during {provider} stream: {e}", exc_info=True)
         yield f"[Error: An unexpected error occurred: {e}]"
+    finally:
+        metrics.observe("ilearn_llm_stream_seconds", time.perf_counter() - started, provider=provider_lower)
@@ -0,0 +1,151 @@
+import os
+import time
+import bisect
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# Instrumentation is off unless METRICS_ENABLED=true (or enable() is called); when off, every hook is a flag check
+_enabled = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+# Upper bounds in seconds; wide enough for sub-millisecond FAISS searches and multi-second LLM streams
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last slot is +Inf
+        self.sum, self.count = 0.0, 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        cumulative, running = {}, 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            running += n
+            cumulative[bound] = running
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+_lock = threading.Lock()
+_histograms, _counters, _gauges = {}, {}, {}
+_callbacks = []
+
+def enabled() -> bool:
+    return _enabled
+
+def enable(flag: bool = True):
+    """Turns instrumentation on or off at runtime."""
+    global _enabled
+    _enabled = flag
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+def _notify(kind: str, name: str, value: float, labels: dict):
+    for callback in _callbacks:
+        try:
+            callback(kind, name, value, labels)
+        except Exception as e:
+            log.warning(f"Metrics callback {callback!r} failed: {e}")
+
+def observe(name: str, value: float, **labels):
+    """Records `value` (seconds, for timings) in the histogram `name`."""
+    if not _enabled: return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None: histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+    if _callbacks: _notify("histogram", name, value, labels)
+
+def inc(name: str, amount: float = 1, **labels):
+    if not _enabled: return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    if _callbacks: _notify("counter", name, amount, labels)
+
+def set_gauge(name: str, value: float, **labels):
+    if not _enabled: return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+    if _callbacks: _notify("gauge", name, value, labels)
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name: str, labels: dict):
+        self.name, self.labels = name, labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL_TIMER = _NullTimer()
+
+def timed(name: str, **labels):
+    """Context manager that records the elapsed time of its block in the histogram `name`."""
+    return _Timer(name, labels) if _enabled else _NULL_TIMER
+
+def register_callback(callback):
+    """
+    Calls `callback(kind, name, value, labels)` synchronously for every recorded value, where kind is
+    "histogram", "counter" or "gauge". Use it to forward metrics to StatsD, OpenTelemetry, logs, etc.
+    Keep callbacks cheap: they run on the instrumented hot path.
+    """
+    _callbacks.append(callback)
+
+def unregister_callback(callback):
+    if callback in _callbacks: _callbacks.remove(callback)
+
+def snapshot() -> dict:
+    """Returns a copy of every metric: {"histograms": {...}, "counters": {...}, "gauges": {...}}, keyed by (name, labels)."""
+    with _lock:
+        return {"histograms": {k: h.to_dict() for k, h in _histograms.items()}, "counters": dict(_counters), "gauges": dict(_gauges)}
+
+def reset():
+    with _lock:
+        _histograms.clear(); _counters.clear(); _gauges.clear()
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs: return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+def prometheus_text() -> str:
+    """Renders the current metrics in the Prometheus text exposition format."""
+    snap = snapshot()
+    lines, typed = [], set()
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+    for (name, labels), value in sorted(snap["counters"].items()):
+        declare(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), value in sorted(snap["gauges"].items()):
+        declare(name, "gauge")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), hist in sorted(snap["histograms"].items()):
+        declare(name, "histogram")
+        for bound, count in hist["buckets"].items():
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf' if bound == float('inf') else repr(bound)),))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {hist['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,273 @@
+import os
+import io
+import json
+import time
+import atexit
+import logging
+import threading
+
+from . import metrics
+from .indexing import item_id
+
+log = logging.getLogger(__name__)
+
+DELTA_DIR = "deltas"
+# Longest wait between retries after failed pushes; the wait doubles per consecutive failure, starting at flush_interval
+HF_PERSIST_MAX_BACKOFF = float(os.getenv("HF_PERSIST_MAX_BACKOFF", "600"))
+
+def replay_operations(items: list, operations: list) -> list:
+    """
+    Applies a sequence of {'op', 'value'} mutations to a list of items, returning the new list.
+    'remove' matches the exact text; 'remove_id' matches the item's id (indexing.item_id).
+    """
+    items = list(items)
+    doomed = set() # Ids from a run of consecutive 'remove_id' operations, applied in one pass
+    for operation in operations:
+        op = operation.get("op")
+        if op == "remove_id":
+            doomed.add(operation["value"])
+            continue
+        if doomed: items, doomed = [i for i in items if item_id(i) not in doomed], set()
+        if op == "add":
+            items.append(operation["value"])
+        elif op == "remove":
+            try: items.remove(operation["value"])
+            except ValueError: pass
+        elif op == "clear":
+            items = []
+    if doomed: items = [i for i in items if item_id(i) not in doomed]
+    return items
+
+def _encode_delta(operations: list) -> bytes:
+    return "".join(json.dumps(op) + "\n" for op in operations).encode("utf-8")
+
+def _decode_delta(data: bytes) -> list:
+    return [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()]
+
+class HFHubClient:
+    """Stores a base dataset plus append-only delta shards in a private Hugging Face dataset repo."""
+    def __init__(self, token: str):
+        self.token = token
+
+    def _api(self):
+        from huggingface_hub import HfApi
+        return HfApi(token=self.token)
+
+    def load_base(self, repo: str, col_name: str) -> list:
+        from datasets import load_dataset
+        try:
+            dataset = load_dataset(repo, token=self.token, trust_remote_code=True)
+        except Exception as e:
+            log.warning(f"Could not load base dataset {repo}: {e}")
+            return []
+        if "train" in dataset and col_name in dataset["train"].column_names:
+            return list(dataset["train"][col_name])
+        return []
+
+    def push_base(self, repo: str, col_name: str, items: list) -> int:
+        from datasets import Dataset
+        Dataset.from_dict({col_name: list(items)}).push_to_hub(repo, token=self.token, private=True)
+        return sum(len(i) for i in items)
+
+    def list_deltas(self, repo: str) -> list:
+        try:
+            files = self._api().list_repo_files(repo, repo_type="dataset")
+        except Exception as e:
+            log.warning(f"Could not list delta shards in {repo}: {e}")
+            return []
+        return sorted(f for f in files if f.startswith(DELTA_DIR + "/") and f.endswith(".jsonl"))
+
+    def read_delta(self, repo: str, path: str) -> list:
+        from huggingface_hub import hf_hub_download
+        local_path = hf_hub_download(repo, path, repo_type="dataset", token=self.token)
+        with open(local_path, 'rb') as f:
+            return _decode_delta(f.read())
+
+    def upload_delta(self, repo: str, name: str, operations: list) -> int:
+        api, data = self._api(), _encode_delta(operations)
+        api.create_repo(repo, repo_type="dataset", private=True, exist_ok=True)
+        api.upload_file(path_or_fileobj=io.BytesIO(data), path_in_repo=f"{DELTA_DIR}/{name}.jsonl", repo_id=repo, repo_type="dataset")
+        return len(data)
+
+    def delete_deltas(self, repo: str, paths: list):
+        if not paths: return
+        from huggingface_hub import CommitOperationDelete
+        self._api().create_commit(repo, repo_type="dataset", operations=[CommitOperationDelete(path_in_repo=p) for p in paths],
+                                  commit_message=f"Compact {len(paths)} delta shards")
+
+class LocalHubClient:
+    """A directory-backed stand-in for the Hugging Face Hub, used for offline runs, tests and benchmarks."""
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def _repo_dir(self, repo: str) -> str:
+        return os.path.join(self.root_dir, repo.replace("/", "__"))
+
+    def load_base(self, repo: str, col_name: str) -> list:
+        path = os.path.join(self._repo_dir(repo), "base.json")
+        if not os.path.exists(path): return []
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get(col_name, [])
+
+    def push_base(self, repo: str, col_name: str, items: list) -> int:
+        os.makedirs(self._repo_dir(repo), exist_ok=True)
+        path = os.path.join(self._repo_dir(repo), "base.json")
+        data = json.dumps({col_name: list(items)}).encode("utf-8")
+        with open(path + ".tmp", 'wb') as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        return len(data)
+
+    def list_deltas(self, repo: str) -> list:
+        delta_dir = os.path.join(self._repo_dir(repo), DELTA_DIR)
+        if not os.path.isdir(delta_dir): return []
+        return sorted(f"{DELTA_DIR}/{f}" for f in os.listdir(delta_dir) if f.endswith(".jsonl"))
+
+    def read_delta(self, repo: str, path: str) -> list:
+        with open(os.path.join(self._repo_dir(repo), path), 'rb') as f:
+            return _decode_delta(f.read())
+
+    def upload_delta(self, repo: str, name: str, operations: list) -> int:
+        delta_dir = os.path.join(self._repo_dir(repo), DELTA_DIR)
+        os.makedirs(delta_dir, exist_ok=True)
+        data = _encode_delta(operations)
+        with open(os.path.join(delta_dir, f"{name}.jsonl"), 'wb') as f:
+            f.write(data)
+        return len(data)
+
+    def delete_deltas(self, repo: str, paths: list):
+        for path in paths:
+            try: os.remove(os.path.join(self._repo_dir(repo), path))
+            except FileNotFoundError: pass
+
+def load_items(hub, repo: str, col_name: str) -> list:
+    """Loads the base dataset and replays any delta shards uploaded since the last compaction."""
+    items = hub.load_base(repo, col_name)
+    for path in hub.list_deltas(repo):
+        try:
+            items = replay_operations(items, hub.read_delta(repo, path))
+        except Exception as e:
+            log.error(f"Failed to replay delta shard {path} from {repo}: {e}")
+    return items
+
+class WriteBehindPersister:
+    """
+    Buffers mutations to one dataset and uploads them from a background thread once
+    `max_pending` operations are queued or `flush_interval` seconds have passed.
+    Each flush uploads a small delta shard; every `compact_every` shards (or after a clear)
+    the full item list is pushed as the new base and the shards are deleted. After a failed push
+    the background thread backs off exponentially before retrying, however much is queued.
+    """
+    def __init__(self, hub, repo: str, col_name: str, initial_items: list,
+                 max_pending: int = 256, flush_interval: float = 30.0, compact_every: int = 20):
+        self.hub, self.repo, self.col_name = hub, repo, col_name
+        self.max_pending, self.flush_interval, self.compact_every = max_pending, flush_interval, compact_every
+        self._items = list(initial_items) # Mirror of what the remote holds after the last flush
+        self._pending = []
+        self._delta_count = len(hub.list_deltas(repo))
+        self._seq = 0
+        self._failures, self._backoff = 0, 0.0 # Consecutive failed pushes and the wait before the next retry
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"ilearn-persist-{col_name}", daemon=True)
+        self._thread.start()
+
+    def record(self, op: str, values: list = ()):
+        """Queues 'add', 'remove' or 'remove_id' operations for `values`, or a 'clear'."""
+        with self._cond:
+            if op == "clear":
+                self._pending.append({"op": "clear"})
+            else:
+                self._pending.extend({"op": op, "value": v} for v in values)
+            if len(self._pending) >= self.max_pending: self._cond.notify()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + (self._backoff if self._failures else self.flush_interval)
+                # While backing off, a full queue does not cut the wait short
+                while not self._closed and (self._failures or len(self._pending) < self.max_pending):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0: break
+                    self._cond.wait(remaining)
+                if self._closed: return
+            try:
+                self.flush()
+            except Exception:
+                pass # Logged by flush(); retried after the backoff
+
+    def flush(self) -> int:
+        """
+        Uploads everything buffered so far. Returns the number of bytes pushed. If the push fails
+        the operations stay queued for a later retry and the error is raised.
+        """
+        with self._flush_lock:
+            with self._cond:
+                operations, self._pending = self._pending, []
+            if not operations: return 0
+            new_items = replay_operations(self._items, operations)
+            needs_compaction = any(op["op"] == "clear" for op in operations) or self._delta_count + 1 >= self.compact_every
+            started = time.perf_counter()
+            try:
+                if needs_compaction:
+                    pushed = self._compact(new_items)
+                else:
+                    self._seq += 1
+                    pushed = self.hub.upload_delta(self.repo, f"{time.time_ns():020d}-{os.getpid()}-{self._seq:06d}", operations)
+                    self._delta_count += 1
+            except Exception as e:
+                metrics.inc("ilearn_hf_push_errors_total", repo=self.repo)
+                with self._cond:
+                    self._pending[:0] = operations # Retry on the next flush
+                    self._failures += 1
+                    self._backoff = min(HF_PERSIST_MAX_BACKOFF, max(self.flush_interval, 1.0) * 2 ** (self._failures - 1))
+                log.error(f"Failed to push {len(operations)} pending operations to {self.repo} (attempt {self._failures}, "
+                          f"retrying in {self._backoff:.0f}s): {e}")
+                raise
+            with self._cond:
+                self._failures = 0
+            self._items = new_items
+            kind = "compaction" if needs_compaction else "delta"
+            metrics.observe("ilearn_hf_push_seconds", time.perf_counter() - started, repo=self.repo, kind=kind)
+            metrics.inc("ilearn_hf_bytes_pushed_total", pushed, repo=self.repo, kind=kind)
+            metrics.inc("ilearn_hf_operations_pushed_total", len(operations), repo=self.repo)
+            log.info(f"Persisted {len(operations)} operations to {self.repo} ({pushed} bytes).")
+            return pushed
+
+    def _compact(self, items: list) -> int:
+        stale_deltas = self.hub.list_deltas(self.repo)
+        pushed = self.hub.push_base(self.repo, self.col_name, items)
+        self.hub.delete_deltas(self.repo, stale_deltas)
+        self._delta_count = 0
+        log.info(f"Compacted {self.repo}: {len(items)} items, {len(stale_deltas)} delta shards merged.")
+        return pushed
+
+    def compact(self) -> int:
+        """Flushes pending operations and rewrites the dataset as a single base."""
+        self.flush()
+        with self._flush_lock:
+            return self._compact(self._items) if self._delta_count else 0
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+        self.flush()
+
+_atexit_persisters = []
+
+def _flush_at_exit():
+    for persister in _atexit_persisters:
+        try: persister.close()
+        except Exception as e: log.error(f"Final flush to {persister.repo} failed: {e}")
+
+atexit.register(_flush_at_exit)
+
+def register_for_exit_flush(persister: WriteBehindPersister):
+    _atexit_persisters.append(persister)
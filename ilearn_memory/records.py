@@ -0,0 +1,265 @@
+import sys
+import json
+import itertools
+from datetime import datetime, timezone
+import numpy as np
+
+_STANDARD_KEYS = ("user_input", "metrics", "bot_response", "timestamp")
+_INTERN_MAX_LEN = 64
+_NUMBER_CACHE_MAX = 65536
+_READ_CHUNK = 4096 # Rows a MemoryTable decodes per step when iterating
+_shared_key_tuples = {}
+_shared_numbers = {}
+_ABSENT = object() # Marks a metric a row does not have in MemoryTable's columns
+
+def _intern(value):
+    """Shares equal short strings and numbers (scores repeat a lot) between records instead of holding a copy each."""
+    if isinstance(value, str): return sys.intern(value) if len(value) <= _INTERN_MAX_LEN else value
+    if type(value) is int or (type(value) is float and value): # Not 0.0, which would also match -0.0
+        shared = _shared_numbers.get(value)
+        if shared is not None and type(shared) is type(value): return shared
+        if len(_shared_numbers) < _NUMBER_CACHE_MAX: _shared_numbers[value] = value
+    return value
+
+def _shared_keys(keys: tuple) -> tuple:
+    """Most memories carry the same metric names, so records share one interned key tuple."""
+    return _shared_key_tuples.setdefault(keys, tuple(sys.intern(str(k)) for k in keys))
+
+class MemoryRecord:
+    """
+    A parsed memory. Records are built once (from JSON at load time, or from fields when added),
+    so reads never re-parse JSON. Metrics are split into a shared key tuple and a per-record
+    value tuple with short strings and numbers interned. A record does not hold its id; the
+    store maps ids to records.
+    """
+    __slots__ = ("user_input", "bot_response", "timestamp", "_metric_keys", "_metric_values")
+    extra = None # Unknown keys from the stored JSON; only _ExtendedMemoryRecord holds any
+
+    def __init__(self, user_input: str, bot_response: str, metrics: dict, timestamp: str):
+        self.user_input, self.bot_response = user_input, bot_response
+        self.timestamp = timestamp
+        metrics = metrics if isinstance(metrics, dict) else {}
+        self._metric_keys = _shared_keys(tuple(metrics))
+        self._metric_values = tuple(_intern(v) for v in metrics.values())
+
+    @classmethod
+    def create(cls, user_input: str, bot_response: str, metrics: dict, timestamp: str, extra: dict = None) -> "MemoryRecord":
+        """A record that also keeps `extra` keys, so memories with unknown fields round-trip."""
+        if not extra: return cls(user_input, bot_response, metrics, timestamp)
+        record = _ExtendedMemoryRecord(user_input, bot_response, metrics, timestamp)
+        record.extra = extra
+        return record
+
+    @classmethod
+    def from_json(cls, memory_json_str: str):
+        """Parses a stored memory; returns None if it is malformed."""
+        try:
+            obj = json.loads(memory_json_str)
+        except (json.JSONDecodeError, TypeError):
+            return None
+        if not isinstance(obj, dict): return None
+        extra = {k: v for k, v in obj.items() if k not in _STANDARD_KEYS}
+        return cls.create(obj.get("user_input", ""), obj.get("bot_response", ""), obj.get("metrics", {}), obj.get("timestamp"), extra)
+
+    @property
+    def epoch(self) -> float | None:
+        """The timestamp as seconds since the epoch (naive timestamps are UTC), or None if it is missing or unparseable."""
+        try:
+            parsed = datetime.fromisoformat(self.timestamp)
+        except (TypeError, ValueError):
+            return None
+        return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+
+    @property
+    def metrics(self) -> dict:
+        return dict(zip(self._metric_keys, self._metric_values))
+
+    def metric(self, name: str, default=None):
+        try:
+            return self._metric_values[self._metric_keys.index(name)]
+        except ValueError:
+            return default
+
+    @property
+    def takeaway(self):
+        return self.metric("takeaway", "N/A")
+
+    @property
+    def embed_text(self) -> str:
+        """The text embedded for this memory, derived from the parsed fields."""
+        return f"User: {self.user_input}\nAI: {self.bot_response}\nTakeaway: {self.takeaway}"
+
+    def to_dict(self) -> dict:
+        mem = {"user_input": self.user_input, "metrics": self.metrics, "bot_response": self.bot_response, "timestamp": self.timestamp}
+        if self.extra: mem.update(self.extra)
+        return mem
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+class _ExtendedMemoryRecord(MemoryRecord):
+    __slots__ = ("extra",)
+
+class MemoryTable:
+    """
+    A read-only {id: MemoryRecord} mapping that stores memories column by column instead of as
+    one object per memory. The texts of every memory share a single UTF-8 buffer addressed by an
+    offset array, ids sit in an int64 array (looked up by binary search), and each metric name
+    is one column of references to interned values. Records are built on access. A snapshot's
+    base memories are held this way; the few recent ones in its delta stay MemoryRecords.
+    """
+    __slots__ = ("_ids", "_order", "_text", "_offsets", "_schemas", "_schema", "_metrics", "_sparse")
+
+    def __init__(self, ids, order, text, offsets, schemas, schema, metrics, sparse):
+        self._ids, self._order = ids, order
+        self._text, self._offsets = text, offsets # Row r spans offsets[3r:3r+4]: timestamp, user input, bot response
+        self._schemas, self._schema = schemas, schema # Metric key tuples, and the index of each row's
+        self._metrics = metrics # Metric name -> object array of values (_ABSENT where a row lacks it)
+        self._sparse = sparse # Row -> MemoryRecord, kept whole for the rare rows with extra keys or non-string fields
+
+    @classmethod
+    def from_items(cls, items) -> "MemoryTable":
+        """Packs (id, MemoryRecord) pairs, keeping their order."""
+        ids, parts, lengths, schema_rows, columns, sparse = [], [], [], [], {}, {}
+        schema_index = {}
+        for row, (item_id, record) in enumerate(items):
+            ids.append(item_id)
+            keys = record._metric_keys
+            schema_rows.append(schema_index.setdefault(keys, len(schema_index)))
+            texts = (record.timestamp, record.user_input, record.bot_response)
+            if record.extra or not all(type(t) is str for t in texts):
+                sparse[row] = record
+                lengths.extend((0, 0, 0))
+                continue
+            texts = tuple(t.encode("utf-8", "surrogatepass") for t in texts)
+            parts.extend(texts)
+            lengths.extend(len(t) for t in texts)
+            for name, value in zip(keys, record._metric_values):
+                column = columns.get(name)
+                if column is None: column = columns[name] = ([], [])
+                column[0].append(row)
+                column[1].append(value)
+        n = len(ids)
+        metrics = {}
+        for name, (rows, values) in columns.items():
+            metrics[name] = _absent_column(n)
+            metrics[name][rows] = _object_array(values)
+        ids = np.asarray(ids, dtype=np.int64)
+        offsets = np.zeros(3 * n + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(ids, np.argsort(ids, kind="stable"), b"".join(parts), offsets, list(schema_index), np.asarray(schema_rows, dtype=np.int32), metrics, sparse)
+
+    def merged(self, removed, added: dict) -> "MemoryTable":
+        """A new table without the `removed` ids and with the `added` {id: MemoryRecord} appended."""
+        table = self
+        if removed:
+            keep = np.flatnonzero(~np.isin(self._ids, np.fromiter(removed, dtype=np.int64, count=len(removed))))
+            if len(keep) < len(self._ids): table = self._select(keep)
+        return table._concat(MemoryTable.from_items(added.items())) if added else table
+
+    def _select(self, rows: np.ndarray) -> "MemoryTable":
+        starts, ends = self._offsets[3 * rows], self._offsets[3 * rows + 3]
+        text = b"".join(self._text[s:e] for s, e in zip(starts.tolist(), ends.tolist()))
+        offsets = np.zeros(3 * len(rows) + 1, dtype=np.int64)
+        np.cumsum(np.diff(self._offsets).reshape(-1, 3)[rows].ravel(), out=offsets[1:])
+        position = {old: new for new, old in enumerate(rows.tolist())} if self._sparse else {}
+        sparse = {position[r]: v for r, v in self._sparse.items() if r in position}
+        ids = self._ids[rows]
+        return MemoryTable(ids, np.argsort(ids, kind="stable"), text, offsets, self._schemas, self._schema[rows],
+                           {name: column[rows] for name, column in self._metrics.items()}, sparse)
+
+    def _concat(self, other: "MemoryTable") -> "MemoryTable":
+        n, m = len(self._ids), len(other._ids)
+        schemas = list(self._schemas)
+        index = {keys: i for i, keys in enumerate(schemas)}
+        remap = np.asarray([index.setdefault(keys, len(index)) for keys in other._schemas] or [0], dtype=np.int32)
+        schemas = list(index)
+        metrics = {}
+        for name in {**self._metrics, **other._metrics}:
+            column = _absent_column(n + m)
+            if name in self._metrics: column[:n] = self._metrics[name]
+            if name in other._metrics: column[n:] = other._metrics[name]
+            metrics[name] = column
+        ids = np.concatenate([self._ids, other._ids])
+        sparse = dict(self._sparse)
+        sparse.update((n + r, v) for r, v in other._sparse.items())
+        return MemoryTable(ids, np.argsort(ids, kind="stable"), self._text + other._text,
+                           np.concatenate([self._offsets, other._offsets[1:] + self._offsets[-1]]), schemas,
+                           np.concatenate([self._schema, remap[other._schema]]), metrics, sparse)
+
+    def _row(self, item_id) -> int:
+        if not isinstance(item_id, (int, np.integer)) or not len(self._ids) or not -2 ** 63 <= item_id < 2 ** 63: return -1
+        position = int(np.searchsorted(self._ids, item_id, sorter=self._order))
+        if position == len(self._ids): return -1
+        row = int(self._order[position])
+        return row if self._ids[row] == item_id else -1
+
+    def _records(self, start: int, stop: int):
+        """Builds the records of rows [start, stop), reading each column once for the whole range."""
+        text, sparse, schemas = self._text, self._sparse, self._schemas
+        offsets = self._offsets[3 * start:3 * stop + 1].tolist()
+        schema = self._schema[start:stop].tolist()
+        columns = {name: column[start:stop].tolist() for name, column in self._metrics.items()}
+        for n in range(stop - start):
+            if sparse and start + n in sparse:
+                yield sparse[start + n]
+                continue
+            record = MemoryRecord.__new__(MemoryRecord)
+            ts_start, user_start, bot_start, end = offsets[3 * n:3 * n + 4]
+            record.timestamp = text[ts_start:user_start].decode("utf-8", "surrogatepass")
+            record.user_input = text[user_start:bot_start].decode("utf-8", "surrogatepass")
+            record.bot_response = text[bot_start:end].decode("utf-8", "surrogatepass")
+            record._metric_keys = keys = schemas[schema[n]]
+            record._metric_values = tuple(columns[name][n] for name in keys)
+            yield record
+
+    def _record(self, row: int) -> MemoryRecord:
+        return next(self._records(row, row + 1))
+
+    def __contains__(self, item_id) -> bool:
+        return self._row(item_id) >= 0
+
+    def __getitem__(self, item_id) -> MemoryRecord:
+        row = self._row(item_id)
+        if row < 0: raise KeyError(item_id)
+        return self._record(row)
+
+    def get(self, item_id, default=None):
+        row = self._row(item_id)
+        return self._record(row) if row >= 0 else default
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        """Ids in insertion order."""
+        return iter(self._ids.tolist())
+
+    def values(self):
+        return itertools.chain.from_iterable(self._records(start, min(start + _READ_CHUNK, len(self._ids)))
+                                             for start in range(0, len(self._ids), _READ_CHUNK))
+
+    def items(self):
+        return zip(self._ids.tolist(), self.values())
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the buffer and arrays (not the interned values the metric columns point to)."""
+        return len(self._text) + self._ids.nbytes + self._order.nbytes + self._offsets.nbytes + self._schema.nbytes + \
+               sum(column.nbytes for column in self._metrics.values())
+
+def _absent_column(size: int) -> np.ndarray:
+    column = np.empty(size, dtype=object)
+    column.fill(_ABSENT)
+    return column
+
+def _object_array(values: list) -> np.ndarray:
+    array = np.empty(len(values), dtype=object)
+    array[:] = values # Element-wise, so tuple or list values stay single objects
+    return array
+
+def merge_memory_items(base_items, removed, added: dict) -> MemoryTable:
+    """SnapshotStore item merging for memories: the merged base is packed into a MemoryTable."""
+    if isinstance(base_items, MemoryTable): return base_items.merged(removed, added)
+    kept = ((i, r) for i, r in base_items.items() if i not in removed) if removed else base_items.items()
+    return MemoryTable.from_items(list(kept) + list(added.items()))
@@ -0,0 +1,84 @@
+"""
+Retention policies for the memory store. This module only decides which memories go: those past
+the maximum age, those scoring below the minimum, the lowest-ranked ones while the store is over
+capacity, and near-duplicates of a better memory. storage.apply_retention() and
+storage.compact_memories() remove them from the index, the items and the backend together.
+
+A memory's rank is its score metric, then its timestamp: when memories have to go, the lowest
+scoring go first, and the oldest among equal scores.
+"""
+import os
+import time
+import heapq
+import numpy as np
+
+from .indexing import faiss
+
+MEMORY_MAX_ITEMS = int(os.getenv("MEMORY_MAX_ITEMS", "0")) # 0 = unbounded
+MEMORY_MAX_AGE_DAYS = float(os.getenv("MEMORY_MAX_AGE_DAYS", "0")) # 0 = keep forever
+MEMORY_MIN_SCORE = float(os.getenv("MEMORY_MIN_SCORE")) if os.getenv("MEMORY_MIN_SCORE") else None
+MEMORY_SCORE_METRIC = os.getenv("MEMORY_SCORE_METRIC", "score") # Numeric key in each memory's `metrics`
+MEMORY_DEDUP_THRESHOLD = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0")) # Cosine similarity; 0 = no compaction
+MEMORY_RETENTION_INTERVAL = float(os.getenv("MEMORY_RETENTION_INTERVAL", "0")) # Seconds between background sweeps; 0 = off
+
+_DEFAULT_SCORE = 0.5 # For memories without a numeric score metric
+_RANGE_SEARCH_BATCH = 4096
+
+def score(record) -> float:
+    value = record.metric(MEMORY_SCORE_METRIC)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return _DEFAULT_SCORE
+
+def rank(record) -> tuple:
+    """Sort key: higher means more worth keeping. Memories without a readable timestamp count as the oldest."""
+    return (score(record), record.epoch or 0.0)
+
+def capacity_target(max_items: int) -> int:
+    """Size to evict down to once a store exceeds `max_items`; the 5% headroom keeps eviction off the per-add path."""
+    return max_items - max(1, max_items // 20)
+
+def expired_ids(items, max_age_days: float, now: float = None) -> list:
+    """Ids of the (id, record) `items` older than `max_age_days`. Memories without a readable timestamp never expire."""
+    if not max_age_days or max_age_days <= 0: return []
+    cutoff = (now if now is not None else time.time()) - max_age_days * 86400
+    return [i for i, r in items if (r.epoch or cutoff) < cutoff]
+
+def low_score_ids(items, min_score: float) -> list:
+    """Ids of the (id, record) `items` whose score metric is below `min_score`. Memories without one are kept."""
+    if min_score is None: return []
+    found = []
+    for i, r in items:
+        value = r.metric(MEMORY_SCORE_METRIC)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value < min_score: found.append(i)
+    return found
+
+def overflow_ids(items, count: int, max_items: int) -> list:
+    """Ids of the lowest-ranked (id, record) `items` to evict so that `count` memories fit `max_items` (down to capacity_target)."""
+    if not max_items or max_items <= 0 or count <= max_items: return []
+    return [i for i, _ in heapq.nsmallest(count - capacity_target(max_items), items, key=lambda item: rank(item[1]))]
+
+def near_duplicate_ids(ids: list, vectors: np.ndarray, ranks: list, threshold: float) -> list:
+    """
+    Ids to drop so that no two kept memories have a cosine similarity at or above `threshold`.
+    Memories are visited best-ranked first; each one kept claims every unvisited neighbour within
+    the threshold, so of each group of near-duplicates only the best-ranked memory survives.
+    """
+    if not threshold or threshold <= 0 or len(ids) < 2: return []
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32).copy()
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    neighbours = {}
+    for start in range(0, len(ids), _RANGE_SEARCH_BATCH):
+        lims, _, found = index.range_search(vectors[start:start + _RANGE_SEARCH_BATCH], threshold)
+        for row in range(len(lims) - 1):
+            hits = found[lims[row]:lims[row + 1]]
+            if len(hits) > 1: neighbours[start + row] = hits
+    dropped, kept = set(), set()
+    for position in sorted(neighbours, key=lambda p: ranks[p], reverse=True):
+        if position in dropped: continue
+        kept.add(position)
+        dropped.update(int(p) for p in neighbours[position] if p not in kept)
+    return [ids[p] for p in sorted(dropped)]
@@ -0,0 +1,136 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from . import storage
+
+log = logging.getLogger(__name__)
+
+COALESCE_MAX_WAIT_MS = float(os.getenv("RETRIEVAL_COALESCE_MAX_WAIT_MS", "2"))
+COALESCE_MAX_BATCH = int(os.getenv("RETRIEVAL_COALESCE_MAX_BATCH", "32"))
+COALESCE_STATS_WINDOW = int(os.getenv("RETRIEVAL_COALESCE_STATS_WINDOW", "10000")) # Latest request latencies kept for stats()
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values: return 0.0
+    rank = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[rank]
+
+def latency_summary(latencies_s: list) -> dict:
+    values = sorted(latencies_s)
+    return {"count": len(values), "p50_ms": _percentile(values, 50) * 1000, "p99_ms": _percentile(values, 99) * 1000}
+
+class RetrievalCoalescer:
+    """
+    Gathers concurrent single-query retrievals that arrive within `max_wait_ms` of each other
+    (up to `max_batch` queries) and serves them with one `retrieve_semantic_batch` call.
+    Latency percentiles cover the last RETRIEVAL_COALESCE_STATS_WINDOW requests; batch counts
+    cover its whole life.
+    """
+    def __init__(self, max_wait_ms: float = None, max_batch: int = None):
+        self.max_wait_ms = COALESCE_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+        self.max_batch = max_batch or COALESCE_MAX_BATCH
+        self._queue = queue.Queue()
+        self._latencies = deque(maxlen=COALESCE_STATS_WINDOW)
+        self._batches, self._batched_requests = 0, 0
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="ilearn-retrieval-coalescer", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, k_memories: int = 3, k_rules: int = 5) -> Future:
+        if self._closed: raise RuntimeError("RetrievalCoalescer is closed.")
+        future = Future()
+        self._queue.put((query, k_memories, k_rules, future, time.perf_counter()))
+        return future
+
+    def retrieve(self, query: str, k_memories: int = 3, k_rules: int = 5) -> dict:
+        """Blocking single-query call; returns {"memories": [...], "rules": [...]}."""
+        return self.submit(query, k_memories, k_rules).result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            requests = [r for r in batch if r is not None]
+            if requests: self._serve(requests)
+            if stop: return
+
+    def _serve(self, requests: list):
+        try:
+            results = storage.retrieve_semantic_batch([r[0] for r in requests], max(r[1] for r in requests), max(r[2] for r in requests))
+        except Exception as e:
+            for *_, future, _ in requests: future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        for (_, k_memories, k_rules, future, submitted), result in zip(requests, results):
+            future.set_result({"memories": result["memories"][:k_memories], "rules": result["rules"][:k_rules]})
+        with self._stats_lock:
+            self._latencies.extend(finished - r[-1] for r in requests)
+            self._batches += 1
+            self._batched_requests += len(requests)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            latencies, batches, batched_requests = list(self._latencies), self._batches, self._batched_requests
+        summary = latency_summary(latencies)
+        summary["batches"] = batches
+        summary["mean_batch_size"] = batched_requests / batches if batches else 0.0
+        return summary
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+def compare_latency(queries: list, threads: int = 8, k_memories: int = 3, k_rules: int = 5, coalescer: RetrievalCoalescer = None) -> dict:
+    """
+    Replays `queries` from `threads` concurrent callers twice: once through the per-call path
+    (`retrieve_memories_semantic` + `retrieve_rules_semantic`) and once through a coalescer.
+    The retrieval caches are cleared before each pass, so neither replays the other's encodings
+    or results. Returns p50/p99 latency and throughput for both.
+    """
+    def per_call(query):
+        started = time.perf_counter()
+        storage.retrieve_memories_semantic(query, k_memories)
+        storage.retrieve_rules_semantic(query, k_rules)
+        return time.perf_counter() - started
+
+    own_coalescer = coalescer is None
+    coalescer = coalescer or RetrievalCoalescer()
+    def coalesced(query):
+        started = time.perf_counter()
+        coalescer.retrieve(query, k_memories, k_rules)
+        return time.perf_counter() - started
+
+    report = {}
+    try:
+        for name, fn in (("per_call", per_call), ("coalesced", coalesced)):
+            storage.clear_retrieval_caches()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                latencies = list(pool.map(fn, queries))
+            summary = latency_summary(latencies)
+            summary["qps"] = len(queries) / (time.perf_counter() - started)
+            report[name] = summary
+        report["coalesced"]["mean_batch_size"] = coalescer.stats()["mean_batch_size"]
+    finally:
+        if own_coalescer: coalescer.close()
+    log.info(f"Retrieval latency per-call p50/p99={report['per_call']['p50_ms']:.2f}/{report['per_call']['p99_ms']:.2f}ms, "
+             f"coalesced p50/p99={report['coalesced']['p50_ms']:.2f}/{report['coalesced']['p99_ms']:.2f}ms")
+    return report
@@ -0,0 +1,195 @@
+"""
+Shared mode: one service process holds the embedding model, the FAISS indices and the backend
+connection, and every worker process forwards storage calls to it over a Unix socket
+(a multiprocessing manager). Workers load no model and keep no index copy, and a write made
+through any worker is visible to all of them on their next call.
+
+  SHARED_MODE=client  workers connect to a running service (`python -m ilearn_memory.shared`)
+  SHARED_MODE=auto    the first worker to find no service starts one, then all connect to it
+"""
+import os
+import sys
+import time
+import signal
+import secrets
+import tempfile
+import inspect
+import logging
+import functools
+import threading
+import subprocess
+import collections.abc
+from concurrent.futures import Future
+from multiprocessing.managers import BaseManager
+
+log = logging.getLogger(__name__)
+
+SHARED_MODE = os.getenv("SHARED_MODE", "off").lower() # off | client | auto
+SHARED_SOCKET_PATH = os.getenv("SHARED_SOCKET_PATH", os.path.join(os.path.dirname(os.getenv("SQLITE_DB_PATH", "app_data/ai_memory.db")) or ".", "ilearn.sock"))
+SHARED_AUTHKEY = os.getenv("SHARED_AUTHKEY") # Unset: a random key kept in SHARED_SOCKET_PATH + ".key" (mode 0600)
+SHARED_CONNECT_TIMEOUT = float(os.getenv("SHARED_CONNECT_TIMEOUT", "300")) # Covers the model load when auto-starting
+
+_delegated = set() # Names of storage functions marked with @delegated
+_is_service = False
+_client, _client_pid, _client_lock = None, None, threading.Lock()
+
+class _ServiceManager(BaseManager):
+    pass
+
+class MemoryService:
+    """
+    Runs in the service process and executes forwarded calls against its own storage module.
+    Calls from different workers run concurrently: storage searches immutable snapshots and
+    serializes its own writers, so reads never wait behind a write.
+    """
+    def __init__(self):
+        from . import storage
+        self._storage = storage
+
+    def call(self, name: str, args: tuple, kwargs: dict):
+        if name not in _delegated: raise AttributeError(f"'{name}' is not available over the shared service.")
+        result = getattr(self._storage, name)(*args, **kwargs)
+        return list(result) if inspect.isgenerator(result) else result
+
+def client_mode() -> bool:
+    """True in a worker process that should forward storage calls to the service."""
+    return SHARED_MODE in ("client", "auto") and not _is_service
+
+def delegated(fn):
+    """Marks a public storage function; in client mode it runs in the service process instead of here."""
+    name = fn.__name__
+    _delegated.add(name)
+    returns_iterator = inspect.isgeneratorfunction(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not client_mode(): return fn(*args, **kwargs)
+        result = client().call(name, tuple(_picklable(a) for a in args), {k: _picklable(v) for k, v in kwargs.items()})
+        return iter(result) if returns_iterator else result
+    return wrapper
+
+def _picklable(value):
+    # Generators and other one-shot iterators (e.g. passed to add_memories_bulk) cannot cross the socket
+    return list(value) if isinstance(value, collections.abc.Iterator) else value
+
+def _authkey() -> bytes:
+    """
+    SHARED_AUTHKEY, or else the key in the file next to the socket, created with a random key if
+    absent. Calls are pickles, so the key is what stops other local users from running code in the
+    service: the file must be private to this user.
+    """
+    if SHARED_AUTHKEY: return SHARED_AUTHKEY.encode("utf-8")
+    path = SHARED_SOCKET_PATH + ".key"
+    key_dir = os.path.dirname(path) or "."
+    os.makedirs(key_dir, exist_ok=True)
+    if not os.path.exists(path):
+        fd, tmp = tempfile.mkstemp(dir=key_dir, prefix=".ilearn-key-") # Created with mode 0600
+        try:
+            with os.fdopen(fd, "w") as f: f.write(secrets.token_hex(32))
+            os.link(tmp, path) # Atomic: if another process got there first, use its key
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp)
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(f"{path} must be owned by this user and not accessible to others (chmod 600).")
+    with open(path) as f:
+        return f.read().strip().encode("utf-8")
+
+def _connect():
+    manager = _ServiceManager(address=SHARED_SOCKET_PATH, authkey=_authkey())
+    manager.connect()
+    return manager.memory_service()
+
+def client():
+    """Returns this process's proxy to the service, connecting (and in auto mode starting it) on first use."""
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid(): return _client
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid(): # Connections do not survive fork
+            _client, _client_pid = _connect_or_start(), os.getpid()
+    return _client
+
+def _connect_or_start():
+    try:
+        return _connect()
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        if SHARED_MODE != "auto": raise ConnectionError(f"No ilearn_memory service at {SHARED_SOCKET_PATH}. Start one with `python -m ilearn_memory.shared`.") from e
+    _start_service_once()
+    deadline = time.monotonic() + SHARED_CONNECT_TIMEOUT
+    while True:
+        try:
+            return _connect()
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline: raise ConnectionError(f"The ilearn_memory service did not come up at {SHARED_SOCKET_PATH} within {SHARED_CONNECT_TIMEOUT:.0f}s.")
+            time.sleep(0.2)
+
+def _start_service_once():
+    """Starts the service unless another worker already has; a file lock makes exactly one worker do it."""
+    try:
+        import fcntl # POSIX only, so imported here rather than by everything that imports storage
+    except ImportError:
+        raise ConnectionError("SHARED_MODE=auto needs a POSIX system (it serves over a Unix socket).") from None
+    socket_dir = os.path.dirname(SHARED_SOCKET_PATH)
+    if socket_dir: os.makedirs(socket_dir, exist_ok=True)
+    with open(SHARED_SOCKET_PATH + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            _connect()
+            return # Another worker won the race
+        except (FileNotFoundError, ConnectionRefusedError):
+            pass
+        log.info(f"Starting shared ilearn_memory service at {SHARED_SOCKET_PATH}...")
+        if os.path.exists(SHARED_SOCKET_PATH + ".ready"): os.unlink(SHARED_SOCKET_PATH + ".ready")
+        proc = subprocess.Popen([sys.executable, "-m", "ilearn_memory.shared"], start_new_session=True,
+                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=None)
+        deadline = time.monotonic() + SHARED_CONNECT_TIMEOUT
+        while not os.path.exists(SHARED_SOCKET_PATH + ".ready"): # Hold the lock until it listens
+            if proc.poll() is not None: raise ConnectionError(f"The ilearn_memory service exited during startup (code {proc.returncode}).")
+            if time.monotonic() > deadline: return
+            time.sleep(0.2)
+
+def connect(background: bool = False):
+    """Client-mode initialize_memory_system(): connects to the service and waits until its store is ready."""
+    if not background: return client().call("wait_until_ready", (), {})
+    future = Future()
+    def run():
+        try: future.set_result(client().call("wait_until_ready", (), {}))
+        except BaseException as e: future.set_exception(e)
+    threading.Thread(target=run, name="ilearn-shared-connect", daemon=True).start()
+    return future
+
+def serve(embedder=None):
+    """Runs the service in this process until it is terminated: loads the model and indices once, then serves workers."""
+    global _is_service
+    _is_service = True
+    from . import storage
+    storage.initialize_memory_system(embedder=embedder)
+    if not storage.wait_until_ready(): raise RuntimeError("The memory system failed to initialize; see the log above.")
+
+    service = MemoryService()
+    _ServiceManager.register("memory_service", callable=lambda: service, exposed=("call",))
+    for stale in (SHARED_SOCKET_PATH, SHARED_SOCKET_PATH + ".ready"):
+        if os.path.exists(stale): os.unlink(stale) # Left by a service that died
+    manager = _ServiceManager(address=SHARED_SOCKET_PATH, authkey=_authkey())
+    previous_umask = os.umask(0o077) # The socket is private from the moment it exists
+    try:
+        server = manager.get_server()
+    finally:
+        os.umask(previous_umask)
+    open(SHARED_SOCKET_PATH + ".ready", "w").close()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0)) # Exit through atexit so pending writes are flushed
+    log.info(f"Shared ilearn_memory service listening on {SHARED_SOCKET_PATH} (pid {os.getpid()}).")
+    try:
+        server.serve_forever()
+    finally:
+        try: os.unlink(SHARED_SOCKET_PATH + ".ready") # The Listener's finalizer removes the socket itself
+        except FileNotFoundError: pass
+
+_ServiceManager.register("memory_service") # Client side: proxies only
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from ilearn_memory.shared import serve as _serve # Run via the package module, which storage sees, not __main__
+    _serve()
@@ -0,0 +1,261 @@
+"""
+Copy-on-write snapshots of a store (its FAISS index and items), so searches never take a lock.
+
+A published Snapshot is never modified. It is a large base index with its items, plus a small
+delta of recently added vectors (a plain array, searched exactly) and a set of tombstoned base
+ids. Writers are serialized: each stages its changes in a Draft, copies only the small delta and
+publishes the result with a single reference assignment, so a reader always sees an index and an
+item set that match. Once the delta outgrows SNAPSHOT_DELTA_MAX, the writer folds it into a copy of
+the base index instead, so the whole index is only copied once every few hundred writes.
+
+Filtered searches (see filters.py) use attribute columns built once per base index and shared by
+every snapshot over it, plus per-item attributes kept for the delta.
+"""
+import os
+import itertools
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+from . import indexing
+from .filters import Columns, FILTER_EXACT_MAX
+from .indexing import faiss
+
+SNAPSHOT_DELTA_MAX = int(os.getenv("SNAPSHOT_DELTA_MAX", "1024"))
+
+class _BaseColumns:
+    """Filter columns of one base index, built on the first filtered search and shared by every snapshot over that index."""
+    __slots__ = ("attributes", "_columns", "_lock")
+
+    def __init__(self, attributes=None):
+        self.attributes = attributes
+        self._columns, self._lock = None, threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._columns is not None
+
+    def get(self, base_items: dict) -> Columns:
+        if self.attributes is None: raise ValueError("This store does not support filtered search.")
+        if self._columns is None:
+            with self._lock:
+                if self._columns is None: self._columns = Columns(base_items, self.attributes)
+        return self._columns
+
+class Snapshot:
+    """An immutable view of one store: a read-only {id: item} mapping that can also be searched."""
+    __slots__ = ("base", "base_items", "columns", "delta_ids", "delta_vectors", "delta_norms", "delta_items", "delta_attributes", "removed", "version")
+
+    def __init__(self, base, base_items: dict, delta_ids=None, delta_vectors=None, delta_items: dict = None, removed=frozenset(), version: int = 0,
+                 columns: _BaseColumns = None, delta_attributes: dict = None):
+        self.base, self.base_items = base, base_items
+        self.columns = columns or _BaseColumns()
+        self.delta_ids = delta_ids if delta_ids is not None else np.zeros(0, dtype=np.int64)
+        self.delta_vectors = delta_vectors if delta_vectors is not None else np.zeros((0, base.d), dtype=np.float32)
+        self.delta_norms = (self.delta_vectors ** 2).sum(axis=1)
+        self.delta_items = delta_items or {}
+        self.delta_attributes = delta_attributes or {}
+        self.removed, self.version = frozenset(removed), version
+
+    def __contains__(self, item_id) -> bool:
+        return item_id in self.delta_items or (item_id in self.base_items and item_id not in self.removed)
+
+    def __getitem__(self, item_id):
+        if item_id in self.delta_items: return self.delta_items[item_id]
+        if item_id in self.removed: raise KeyError(item_id)
+        return self.base_items[item_id]
+
+    def get(self, item_id, default=None):
+        return self[item_id] if item_id in self else default
+
+    def __len__(self) -> int:
+        return len(self.base_items) - len(self.removed) + len(self.delta_items)
+
+    def __iter__(self):
+        """Ids in insertion order."""
+        base_ids = (i for i in self.base_items if i not in self.removed) if self.removed else iter(self.base_items)
+        return itertools.chain(base_ids, self.delta_items)
+
+    def items(self):
+        """(id, item) pairs in insertion order."""
+        base = ((i, v) for i, v in self.base_items.items() if i not in self.removed) if self.removed else self.base_items.items()
+        return itertools.chain(base, self.delta_items.items())
+
+    def values(self):
+        return (v for _, v in self.items())
+
+    def search(self, query_embeddings: np.ndarray, k: int, where=None) -> list:
+        """
+        Returns the ids of the k nearest live items for each query, nearest first. With a
+        filters.Filter `where`, only matching items are scored. Up to FILTER_EXACT_MAX matching base
+        items are read back from the index and scored exactly; more are searched through an ID
+        selector (see indexing.selector_params), and the delta through a mask.
+        """
+        if k <= 0 or not len(self): return [[] for _ in range(len(query_embeddings))]
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        distances, ids = [], []
+        if self.base.ntotal:
+            if where:
+                candidates = self.columns.get(self.base_items).select(where)
+                if self.removed and len(candidates):
+                    candidates = candidates[~np.isin(candidates, np.fromiter(self.removed, dtype=np.int64, count=len(self.removed)))]
+                if len(candidates) and len(candidates) <= FILTER_EXACT_MAX and indexing.can_reconstruct(self.base):
+                    vectors = self.base.reconstruct_batch(candidates)
+                    d, i = _exact_top_k(queries, candidates, vectors, (vectors ** 2).sum(axis=1), k)
+                    distances.append(d)
+                    ids.append(i)
+                elif len(candidates):
+                    params, selector = indexing.selector_params(self.base, candidates) # `selector` must outlive the search
+                    d, i = self.base.search(queries, min(k, len(candidates)), params=params)
+                    distances.append(d)
+                    ids.append(i)
+            else:
+                # Over-fetch by the number of tombstones so they cannot crowd live items out of the top k
+                d, i = self.base.search(queries, min(k + len(self.removed), self.base.ntotal))
+                distances.append(d)
+                ids.append(i)
+        delta_ids, delta_vectors, delta_norms = self.delta_ids, self.delta_vectors, self.delta_norms
+        if where and len(delta_ids):
+            keep = np.fromiter((where.matches(self.delta_attributes[i]) for i in delta_ids.tolist()), dtype=bool, count=len(delta_ids))
+            delta_ids, delta_vectors, delta_norms = delta_ids[keep], delta_vectors[keep], delta_norms[keep]
+        if len(delta_ids):
+            d, i = _exact_top_k(queries, delta_ids, delta_vectors, delta_norms, k)
+            distances.append(d)
+            ids.append(i)
+        if not ids: return [[] for _ in range(len(queries))]
+        distances, ids = np.hstack(distances), np.hstack(ids)
+        ranked = np.take_along_axis(ids, np.argsort(distances, axis=1, kind="stable"), axis=1)
+        return [[i for i in row if i >= 0 and i not in self.removed][:k] for row in ranked.tolist()]
+
+def _exact_top_k(queries: np.ndarray, ids: np.ndarray, vectors: np.ndarray, norms: np.ndarray, k: int) -> tuple:
+    """Brute-force (distances, ids) of the k nearest of `vectors` per query, in squared L2 like IndexFlatL2; unsorted."""
+    d = (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ vectors.T + norms[None, :]
+    top = np.argpartition(d, min(k, len(ids)) - 1, axis=1)[:, :k]
+    return np.take_along_axis(d, top, axis=1), ids[top]
+
+class Draft:
+    """Changes staged against a snapshot by the writer that holds the store's lock."""
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        self.cleared = False
+        self._added = {} # id -> (item, vector)
+        self._removed = set()
+
+    def __contains__(self, item_id) -> bool:
+        return item_id in self._added or (not self.cleared and item_id in self.snapshot and item_id not in self._removed)
+
+    @property
+    def changed(self) -> bool:
+        return self.cleared or bool(self._added) or bool(self._removed)
+
+    def add(self, ids: list, vectors: np.ndarray, items: list) -> list:
+        """Stages items that are not already present. Returns the ids actually added."""
+        added = []
+        for i, vector, item in zip(ids, vectors, items):
+            if i in self: continue
+            self._added[i] = (item, vector)
+            added.append(i)
+        return added
+
+    def remove(self, ids: list) -> list:
+        """Stages removals of items that are present. Returns the ids actually removed."""
+        removed = []
+        for i in ids:
+            if i not in self: continue
+            if self._added.pop(i, None) is None: self._removed.add(i)
+            removed.append(i)
+        return removed
+
+    def clear(self):
+        self.cleared = True
+        self._added.clear()
+        self._removed.clear()
+
+class SnapshotStore:
+    """
+    Holds the current Snapshot of one store. Readers use `current` and never lock; writers go
+    through `writing()`, one at a time.
+    """
+    def __init__(self, base, items: dict, attributes=None, merge_items=None):
+        """
+        `attributes(item) -> dict` enables filtered search (see filters.rule_attributes and
+        filters.memory_attributes). `merge_items(base_items, removed, added) -> mapping` builds the
+        items of a merged base index; by default they are a plain dict (see records.merge_memory_items).
+        """
+        self._attributes = attributes
+        self._merge_items = merge_items or _merge_items
+        self.current = Snapshot(base, self._merge_items(items, (), {}), columns=_BaseColumns(attributes))
+        self._write_lock = threading.Lock()
+
+    @contextmanager
+    def writing(self):
+        """
+        Yields a Draft of the current snapshot. Its changes are published as one new snapshot when
+        the block exits normally, and discarded if it raises. Backend writes made inside the block
+        are therefore ordered exactly like the snapshots they belong to.
+        """
+        with self._write_lock:
+            draft = Draft(self.current)
+            yield draft
+            if draft.changed: self.current = self._apply(draft)
+
+    def compact(self) -> Snapshot:
+        """Folds the delta and tombstones into the base index and returns the (possibly unchanged) current snapshot."""
+        with self._write_lock:
+            snapshot = self.current
+            if len(snapshot.delta_ids) or snapshot.removed:
+                self.current = self._merge(snapshot, snapshot.base, snapshot.base_items, snapshot.delta_ids, snapshot.delta_vectors,
+                                           snapshot.delta_items, set(snapshot.removed), snapshot.version) # Same contents, same version
+            return self.current
+
+    def _apply(self, draft: Draft) -> Snapshot:
+        snapshot, version = draft.snapshot, draft.snapshot.version + 1
+        if draft.cleared:
+            base, base_items, delta_ids, delta_vectors = indexing.new_index(snapshot.base.d), {}, snapshot.delta_ids[:0], snapshot.delta_vectors[:0]
+            delta_items, delta_attributes, removed, columns = {}, {}, set(), _BaseColumns(self._attributes)
+        else:
+            base, base_items, delta_ids, delta_vectors = snapshot.base, snapshot.base_items, snapshot.delta_ids, snapshot.delta_vectors
+            delta_items, delta_attributes, removed, columns = dict(snapshot.delta_items), dict(snapshot.delta_attributes), set(snapshot.removed), snapshot.columns
+        dropped = set()
+        for i in draft._removed:
+            if i in delta_items:
+                del delta_items[i]
+                delta_attributes.pop(i, None)
+                dropped.add(i)
+            else:
+                removed.add(i) # Tombstone a base item
+        if dropped:
+            keep = ~np.isin(delta_ids, np.fromiter(dropped, dtype=np.int64, count=len(dropped)))
+            delta_ids, delta_vectors = delta_ids[keep], delta_vectors[keep]
+        new_ids, new_vectors = [], []
+        for i, (item, vector) in draft._added.items():
+            if i in removed and i in base_items:
+                removed.discard(i) # Re-added: ids are content hashes, so the base still holds its vector
+                continue
+            delta_items[i] = item
+            if self._attributes: delta_attributes[i] = self._attributes(item)
+            new_ids.append(i)
+            new_vectors.append(vector)
+        if new_ids:
+            delta_ids = np.concatenate([delta_ids, np.asarray(new_ids, dtype=np.int64)])
+            delta_vectors = np.vstack([delta_vectors, np.asarray(new_vectors, dtype=np.float32)])
+        if len(delta_ids) + len(removed) > SNAPSHOT_DELTA_MAX:
+            return self._merge(snapshot, base, base_items, delta_ids, delta_vectors, delta_items, removed, version)
+        return Snapshot(base, base_items, delta_ids, delta_vectors, delta_items, removed, version, columns, delta_attributes)
+
+    def _merge(self, previous: Snapshot, base, base_items, delta_ids, delta_vectors, delta_items, removed, version) -> Snapshot:
+        # Work on a copy; the published base may be in use by readers
+        merged = faiss.clone_index(base) if base.ntotal else indexing.new_index(base.d)
+        merged = indexing.remove_ids(merged, list(removed))
+        indexing.add_with_ids(merged, delta_vectors, delta_ids)
+        merged = indexing.maybe_upgrade(merged)
+        indexing.apply_search_params(merged)
+        items = self._merge_items(base_items, removed, delta_items)
+        columns = _BaseColumns(self._attributes)
+        if previous.columns.built: columns.get(items) # Filters are in use: build here rather than in the next reader
+        return Snapshot(merged, items, version=version, columns=columns)
+
+def _merge_items(base_items, removed, added: dict) -> dict:
+    items = {i: v for i, v in base_items.items() if i not in removed} if removed else dict(base_items)
+    items.update(added)
+    return items
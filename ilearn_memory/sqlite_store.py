@@ -0,0 +1,206 @@
+import os
+import atexit
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from . import metrics
+from .indexing import item_id
+
+log = logging.getLogger(__name__)
+
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL") # NORMAL is durable across app crashes in WAL mode
+SQLITE_CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", "64"))
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+SQLITE_READ_CONNECTIONS = int(os.getenv("SQLITE_READ_CONNECTIONS", "4")) # Pooled read connections, shared by all threads
+
+# Version 1 (user_version 0) keyed rows by a UNIQUE index over the full text and stored no vectors
+SCHEMA_VERSION = 2
+TABLES = {"memory": ("memories", "memory_json"), "rule": ("rules", "rule_text")}
+
+def _create_table_sql(table: str, col: str) -> str:
+    # content_hash is indexing.item_id(text): the dedup key and the item's FAISS id
+    return (f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, content_hash INTEGER NOT NULL UNIQUE, "
+            f"{col} TEXT NOT NULL, embedding BLOB, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+
+class SQLiteStore:
+    """
+    The SQLITE backend, in WAL mode so readers never block the writer. Writes share one connection
+    and run one at a time; reads borrow one of at most SQLITE_READ_CONNECTIONS pooled connections,
+    so the number of open connections stays bounded however many threads call in. Rows are deduplicated on an 8-byte content hash and carry their float32 embedding, so a
+    restart can rebuild FAISS without re-encoding. Older databases are migrated on open.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        db_dir = os.path.dirname(path)
+        if db_dir: os.makedirs(db_dir, exist_ok=True)
+        self._write_lock = threading.Lock() # One writer at a time in-process; SQLite's busy timeout covers other processes
+        self._writer = None # Only used while holding _write_lock
+        self._pool = threading.Condition()
+        self._idle, self._readers, self._generation = [], 0, 0 # Idle read connections, read connections open, bumped by close()
+        self._migrate()
+        atexit.register(self.close)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size={-SQLITE_CACHE_SIZE_MB * 1024}")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        return conn
+
+    def _write_conn(self) -> sqlite3.Connection:
+        """The shared write connection; callers hold _write_lock."""
+        if self._writer is None: self._writer = self._open()
+        return self._writer
+
+    @contextmanager
+    def _reading(self):
+        """Borrows a pooled read connection, waiting for one to be returned if all are in use."""
+        with self._pool:
+            while not self._idle and self._readers >= max(1, SQLITE_READ_CONNECTIONS): self._pool.wait()
+            generation, conn = self._generation, self._idle.pop() if self._idle else None
+            if conn is None: self._readers += 1
+        try:
+            if conn is None: conn = self._open()
+        except BaseException:
+            with self._pool:
+                self._readers -= 1
+                self._pool.notify()
+            raise
+        try:
+            yield conn
+        finally:
+            with self._pool:
+                if generation == self._generation:
+                    self._idle.append(conn)
+                else: # Borrowed before close(); not part of the current pool
+                    self._readers -= 1
+                    conn.close()
+                self._pool.notify()
+
+    @contextmanager
+    def _transaction(self):
+        with self._write_lock:
+            conn = self._write_conn()
+            try:
+                yield conn
+                with metrics.timed("ilearn_sqlite_commit_seconds"):
+                    conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def _migrate(self):
+        with self._write_lock:
+            conn = self._write_conn()
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION: return
+            conn.create_function("content_hash", 1, item_id, deterministic=True)
+            migrated = False
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table, col in TABLES.values():
+                    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                    if columns and "content_hash" not in columns:
+                        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                        log.info(f"Migrating SQLite table '{table}' ({count} rows) to schema version {SCHEMA_VERSION}...")
+                        conn.execute(f"ALTER TABLE {table} RENAME TO {table}_v1")
+                        conn.execute(_create_table_sql(table, col))
+                        conn.execute(f"INSERT OR IGNORE INTO {table} (id, content_hash, {col}, created_at) "
+                                     f"SELECT id, content_hash({col}), {col}, created_at FROM {table}_v1 ORDER BY id")
+                        conn.execute(f"DROP TABLE {table}_v1")
+                        migrated = True
+                    else:
+                        conn.execute(_create_table_sql(table, col))
+                conn.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            if migrated:
+                try:
+                    conn.execute("VACUUM") # Reclaims the pages of the dropped full-text UNIQUE index
+                except sqlite3.OperationalError as e:
+                    log.warning(f"VACUUM after migration skipped: {e}")
+                log.info("SQLite migration complete. Embeddings will be stored as items are next loaded.")
+
+    def bind_embedding_model(self, model_name: str, dimension: int):
+        """Stored vectors are only reused by the model that wrote them; switching models discards them."""
+        wanted = f"{model_name}|{dimension}"
+        with self._reading() as conn:
+            row = conn.execute("SELECT value FROM store_meta WHERE key = 'embedding_model'").fetchone()
+        if row and row[0] == wanted: return
+        with self._transaction() as conn:
+            if row:
+                log.info(f"Embedding model changed from '{row[0]}' to '{wanted}'; discarding stored vectors.")
+                for table, _ in TABLES.values(): conn.execute(f"UPDATE {table} SET embedding = NULL")
+            conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('embedding_model', ?)", (wanted,))
+
+    def load(self, item_type: str) -> list:
+        """Returns [(content_hash, text, embedding_bytes_or_None)] in insertion order."""
+        table, col = TABLES[item_type]
+        with self._reading() as conn:
+            return conn.execute(f"SELECT content_hash, {col}, embedding FROM {table} ORDER BY id").fetchall()
+
+    def add(self, item_type: str, rows: list):
+        """Inserts (content_hash, text, vector) rows, ignoring ones already stored."""
+        if not rows: return
+        table, col = TABLES[item_type]
+        with self._transaction() as conn:
+            conn.executemany(f"INSERT OR IGNORE INTO {table} (content_hash, {col}, embedding) VALUES (?, ?, ?)",
+                             [(h, text, _blob(vector)) for h, text, vector in rows])
+
+    def remove(self, item_type: str, hashes: list):
+        if not hashes: return
+        table, _ = TABLES[item_type]
+        with self._transaction() as conn:
+            conn.executemany(f"DELETE FROM {table} WHERE content_hash = ?", [(h,) for h in hashes])
+
+    def replace(self, item_type: str, old_hash: int, new_hash: int, new_text: str, vector):
+        """Swaps one item for another, keeping the old row's position."""
+        table, col = TABLES[item_type]
+        with self._transaction() as conn:
+            conn.execute(f"UPDATE OR IGNORE {table} SET content_hash = ?, {col} = ?, embedding = ? WHERE content_hash = ?",
+                         (new_hash, new_text, _blob(vector), old_hash))
+            conn.execute(f"DELETE FROM {table} WHERE content_hash = ?", (old_hash,))
+
+    def update(self, item_type: str, removed: list, rows: list):
+        """Deletes the `removed` hashes and inserts (content_hash, text, vector) rows in one transaction."""
+        if not removed and not rows: return
+        table, col = TABLES[item_type]
+        with self._transaction() as conn:
+            conn.executemany(f"DELETE FROM {table} WHERE content_hash = ?", [(h,) for h in removed])
+            conn.executemany(f"INSERT OR IGNORE INTO {table} (content_hash, {col}, embedding) VALUES (?, ?, ?)",
+                             [(h, text, _blob(vector)) for h, text, vector in rows])
+
+    def clear(self, item_type: str):
+        table, _ = TABLES[item_type]
+        with self._transaction() as conn:
+            conn.execute(f"DELETE FROM {table}")
+
+    def store_vectors(self, item_type: str, vectors: dict):
+        """Backfills {content_hash: vector} for rows stored without an embedding (migrated or model changed)."""
+        if not vectors: return
+        table, _ = TABLES[item_type]
+        with self._transaction() as conn:
+            conn.executemany(f"UPDATE {table} SET embedding = ? WHERE content_hash = ?", [(_blob(v), h) for h, v in vectors.items()])
+
+    def close(self):
+        """Closes every idle connection; ones in use are closed when returned. The store reopens connections on next use."""
+        with self._write_lock:
+            connections, self._writer = [self._writer] if self._writer else [], None
+        with self._pool:
+            connections += self._idle
+            self._readers -= len(self._idle)
+            self._idle, self._generation = [], self._generation + 1
+        for conn in connections:
+            try: conn.close()
+            except sqlite3.Error: pass
+
+def _blob(vector) -> bytes | None:
+    return None if vector is None else vector.astype("float32", copy=False).tobytes()
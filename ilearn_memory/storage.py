@@ -1,26 +1,31 @@
 import os
 import json
 import time
+import atexit
+import itertools
 from datetime import datetime
 import logging
 import re
 import threading
+from concurrent.futures import Future
 import numpy as np
 
-# Conditional imports for optional dependencies
-try:
-    from sentence_transformers import SentenceTransformer
-    import faiss
-except ImportError:
-    SentenceTransformer, faiss = None, None
-try:
-    import sqlite3
-except ImportError:
-    sqlite3 = None
-try:
-    from datasets import load_dataset, Dataset
-except ImportError:
-    load_dataset, Dataset = None, None
+# Optional dependencies; the heavy ones are imported on first use, not when this module loads
+from .lazy import LazyModule
+sentence_transformers = LazyModule("sentence_transformers", "sentence-transformers")
+datasets = LazyModule("datasets")
+
+from .caching import EmbeddingCache, LRUCache
+from . import persistence
+from . import indexing
+from . import metrics
+from . import shared
+from . import retention
+from . import filters
+from .records import MemoryRecord, merge_memory_items
+from .sqlite_store import SQLiteStore
+from .snapshots import SnapshotStore
+from .indexing import faiss, item_id, build_index, indexed_ids, add_with_ids, remove_ids, maybe_upgrade, apply_search_params
 
 log = logging.getLogger(__name__)
 
@@ -30,200 +35,748 @@ SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "app_data/ai_memory.db")
 HF_TOKEN = os.getenv("HF_TOKEN")
 HF_MEMORY_DATASET_REPO = os.getenv("HF_MEMORY_DATASET_REPO")
 HF_RULES_DATASET_REPO = os.getenv("HF_RULES_DATASET_REPO")
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(SQLITE_DB_PATH) or ".", "embedding_cache.db"))
+# SQLITE keeps each item's vector in its row, so the separate cache only pays off for HF_DATASET
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true" if STORAGE_BACKEND == "HF_DATASET" else "false").lower() == "true"
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", os.path.join(os.path.dirname(SQLITE_DB_PATH) or ".", "faiss_snapshots"))
+INDEX_SNAPSHOT_ENABLED = os.getenv("INDEX_SNAPSHOT_ENABLED", "false" if STORAGE_BACKEND == "RAM" else "true").lower() == "true"
+INDEX_SNAPSHOT_MMAP = os.getenv("INDEX_SNAPSHOT_MMAP", "false").lower() == "true"
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "256"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "0")) # Seconds; 0 disables expiry
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "0")) # 0 disables the top-k result cache
+HF_LOCAL_HUB_DIR = os.getenv("HF_LOCAL_HUB_DIR") # Directory-backed stand-in for the Hub (offline runs, tests)
+HF_PERSIST_MAX_PENDING = int(os.getenv("HF_PERSIST_MAX_PENDING", "256"))
+HF_PERSIST_FLUSH_INTERVAL = float(os.getenv("HF_PERSIST_FLUSH_INTERVAL", "30"))
+HF_PERSIST_COMPACT_EVERY = int(os.getenv("HF_PERSIST_COMPACT_EVERY", "20"))
 
 # --- Globals for RAG ---
-_embedder, _dimension = None, 384
-_faiss_memory_index, _memory_items_list = None, []
-_faiss_rules_index, _rules_items_list = None, []
+_embedder, _dimension, _model_name = None, 384, EMBEDDING_MODEL_NAME
+_embedding_cache = None
+_sqlite_store = None
+_persisters = {}
+# One SnapshotStore per item type ("memory", "rule"). Readers search its current snapshot without
+# locking; writers publish a new one. Items are keyed by a stable id (see indexing.item_id) that is
+# also their FAISS vector id. Memories are parsed once into MemoryRecords, which a merged base index
+# packs into a columnar MemoryTable (see records.py); rules are plain strings.
+_stores = {}
 _initialized, _init_lock = False, threading.Lock()
+_init_future, _init_future_lock = None, threading.Lock() # Set by initialize_memory_system(background=True)
+# Query embeddings are cached by text; search results are cached per snapshot version, which every write bumps
+_query_embedding_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+_result_cache = LRUCache(RESULT_CACHE_SIZE, QUERY_CACHE_TTL)
 
-def _get_sqlite_connection():
-    if not sqlite3: raise ImportError("sqlite3 module is required for SQLite backend.")
-    db_dir = os.path.dirname(SQLITE_DB_PATH)
-    if db_dir: os.makedirs(db_dir, exist_ok=True)
-    return sqlite3.connect(SQLITE_DB_PATH, timeout=10)
-
-def _init_sqlite_tables():
+def _open_sqlite_store():
+    global _sqlite_store
     try:
-        with _get_sqlite_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("CREATE TABLE IF NOT EXISTS memories (id INTEGER PRIMARY KEY, memory_json TEXT NOT NULL UNIQUE, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
-            cursor.execute("CREATE TABLE IF NOT EXISTS rules (id INTEGER PRIMARY KEY, rule_text TEXT NOT NULL UNIQUE, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
-            conn.commit()
+        _sqlite_store = SQLiteStore(SQLITE_DB_PATH)
+        _sqlite_store.bind_embedding_model(_model_name, _dimension)
     except Exception as e:
-        log.error(f"SQLite table initialization error: {e}", exc_info=True)
+        _sqlite_store = None
+        log.error(f"SQLite initialization error: {e}", exc_info=True)
+
+def initialize_memory_system(embedder=None, background: bool = False):
+    """
+    Loads the embedding model, the stored memories and rules, and their FAISS indices.
+    `embedder` replaces the SentenceTransformer with any object exposing the same `encode` and
+    `get_sentence_embedding_dimension` methods (and optionally a `model_name`), e.g. an offline stub.
+
+    With `background=True` the work runs in a worker thread and a Future is returned at once; it
+    resolves to True when the store is ready (False if initialization failed). Reads and writes
+    issued meanwhile wait for it instead of seeing an empty store.
+
+    In shared mode (SHARED_MODE=client or auto) this only connects to the service process.
+    """
+    global _init_future
+    if shared.client_mode(): return shared.connect(background) # The service process holds the model and indices
+    if background:
+        with _init_future_lock: # Not _init_lock, which the worker holds while loading
+            if _init_future is None or (_init_future.done() and not _initialized): # First call, or retry after a failure
+                _init_future = Future()
+                if _initialized: _init_future.set_result(True)
+                else: threading.Thread(target=_initialize_in_background, args=(_init_future, embedder), name="ilearn-init", daemon=True).start()
+            return _init_future
+    if _init_future is not None: wait_until_ready() # Don't race the worker with a second load
+    _initialize(embedder)
 
-def initialize_memory_system():
-    global _initialized, _embedder, _dimension, _faiss_memory_index, _memory_items_list, _faiss_rules_index, _rules_items_list
+def _initialize_in_background(future: Future, embedder):
+    try:
+        _initialize(embedder)
+        future.set_result(_initialized)
+    except BaseException as e:
+        log.critical(f"Background initialization failed: {e}", exc_info=True)
+        future.set_exception(e)
+
+@shared.delegated
+def wait_until_ready(timeout: float = None) -> bool:
+    """Blocks until a background initialization finishes (or `timeout` seconds pass). Returns whether the store is ready."""
+    future = _init_future
+    if not _initialized and future is not None:
+        try:
+            future.result(timeout)
+        except Exception:
+            pass # Timed out, or failed (already logged)
+    return _initialized
+
+def _initialize(embedder=None):
+    global _initialized, _embedder, _dimension, _model_name, _embedding_cache
     with _init_lock:
         if _initialized: return
         log.info(f"Initializing memory system with backend: {STORAGE_BACKEND}")
-        if not SentenceTransformer or not faiss:
+        if (not sentence_transformers and embedder is None) or not faiss:
             log.critical("SentenceTransformers or FAISS not installed. Semantic search is unavailable.")
             return
         try:
-            _embedder = SentenceTransformer('all-MiniLM-L6-v2', cache_folder="./sentence_transformer_cache")
+            _embedder = embedder or sentence_transformers.SentenceTransformer(EMBEDDING_MODEL_NAME, cache_folder="./sentence_transformer_cache")
             _dimension = _embedder.get_sentence_embedding_dimension()
+            _model_name = getattr(embedder, "model_name", type(embedder).__name__) if embedder is not None else EMBEDDING_MODEL_NAME
         except Exception as e:
             log.critical(f"Failed to load SentenceTransformer model: {e}", exc_info=True)
             return
+        if EMBEDDING_CACHE_ENABLED:
+            try:
+                _embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, _model_name, _dimension)
+            except Exception as e:
+                log.error(f"Embedding cache unavailable, falling back to direct encoding: {e}")
 
-        if STORAGE_BACKEND == "SQLITE": _init_sqlite_tables()
+        if STORAGE_BACKEND == "SQLITE": _open_sqlite_store()
         
-        # Load Memories and Rules from backend
-        _memory_items_list = _load_data_from_backend("memory")
-        _rules_items_list = _load_data_from_backend("rule")
+        # Load Memories and Rules (and, from SQLite, their stored vectors) from backend
+        memory_list, memory_vectors = _load_data_from_backend("memory")
+        rules_list, rule_vectors = _load_data_from_backend("rule")
+        _start_persister("memory", memory_list)
+        _start_persister("rule", rules_list)
+        memory_items = {i: r for i, r in ((item_id(m), MemoryRecord.from_json(m)) for m in memory_list) if r is not None}
+        if len(memory_items) < len(memory_list): log.warning(f"Skipped {len(memory_list) - len(memory_items)} malformed or duplicate memories.")
+        rules_items = {item_id(r): r for r in rules_list} # Ensure unique before indexing
         
-        # Build FAISS indices
-        _faiss_memory_index = _build_faiss_index(_memory_items_list, "memory")
-        log.info(f"Loaded {len(_memory_items_list)} memories and built FAISS index.")
-        _rules_items_list = sorted(list(set(_rules_items_list))) # Ensure unique before indexing
-        _faiss_rules_index = _build_faiss_index(_rules_items_list, "rule")
-        log.info(f"Loaded {len(_rules_items_list)} rules and built FAISS index.")
+        # Load FAISS indices from their snapshots, or build them
+        _stores["memory"] = SnapshotStore(_load_or_build_faiss_index(memory_items, "memory", memory_vectors), memory_items, filters.memory_attributes, merge_memory_items)
+        memory_items = _stores["memory"].current.base_items # Packed into a MemoryTable; let the parsed records go
+        log.info(f"Loaded {len(memory_items)} memories and their FAISS index.")
+        _stores["rule"] = SnapshotStore(_load_or_build_faiss_index(rules_items, "rule", rule_vectors), rules_items, filters.rule_attributes)
+        log.info(f"Loaded {len(rules_items)} rules and their FAISS index.")
+        if INDEX_SNAPSHOT_ENABLED: atexit.register(save_index_snapshots)
+        metrics.set_gauge("ilearn_index_size", len(memory_items), store="memory")
+        metrics.set_gauge("ilearn_index_size", len(rules_items), store="rule")
+
+        if _embedding_cache:
+            live_texts = [r.embed_text for r in memory_items.values()] + list(rules_items.values())
+            _embedding_cache.retain(_embedding_cache.key(t) for t in live_texts)
         
         _initialized = True
+        if retention.MEMORY_RETENTION_INTERVAL > 0:
+            threading.Thread(target=_retention_sweeper, name="ilearn-retention", daemon=True).start()
 
-def _load_data_from_backend(item_type: str) -> list:
-    """Loads data for either 'memory' or 'rule' from the configured backend."""
+def _load_data_from_backend(item_type: str) -> tuple:
+    """
+    Loads data for either 'memory' or 'rule' from the configured backend. Returns (texts, vectors),
+    where vectors maps item id to the embedding stored alongside it (SQLite only, otherwise empty).
+    """
     col_name = "memory_json" if item_type == "memory" else "rule_text"
     repo_name = HF_MEMORY_DATASET_REPO if item_type == "memory" else HF_RULES_DATASET_REPO
     
-    if STORAGE_BACKEND == "SQLITE" and sqlite3:
+    if STORAGE_BACKEND == "SQLITE" and _sqlite_store:
         try:
-            with _get_sqlite_connection() as conn:
-                return [row[0] for row in conn.execute(f"SELECT {col_name} FROM {item_type}s ORDER BY created_at")]
+            rows = _sqlite_store.load(item_type)
+            vectors = {h: np.frombuffer(blob, dtype=np.float32) for h, _, blob in rows if blob and len(blob) == _dimension * 4}
+            return [text for _, text, _ in rows], vectors
         except Exception as e:
             log.error(f"Error loading {item_type}s from SQLite: {e}")
-    elif STORAGE_BACKEND == "HF_DATASET" and HF_TOKEN and load_dataset and repo_name:
+    elif STORAGE_BACKEND == "HF_DATASET" and _hub_client() and repo_name:
         try:
-            dataset = load_dataset(repo_name, token=HF_TOKEN, trust_remote_code=True)
-            if "train" in dataset and col_name in dataset["train"].column_names:
-                return dataset["train"][col_name]
+            return persistence.load_items(_hub_client(), repo_name, col_name), {}
         except Exception as e:
             log.error(f"Error loading {item_type}s from HF Dataset {repo_name}: {e}")
-    return []
+    return [], {}
 
-def _build_faiss_index(items_list: list, item_type: str):
-    """Helper to build a FAISS index from a list of strings or JSON strings."""
-    index = faiss.IndexFlatL2(_dimension)
-    if not items_list: return index
-    
-    texts_to_embed = []
+def _encode_with_model(texts: list, kind: str) -> np.ndarray:
+    with metrics.timed("ilearn_encode_seconds", kind=kind):
+        vectors = _embedder.encode(texts, convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+    metrics.inc("ilearn_items_encoded_total", len(texts), kind=kind)
+    return vectors
+
+def _encode_texts(texts: list) -> np.ndarray:
+    """Embeds texts, serving previously seen texts from the on-disk embedding cache."""
+    if not texts: return np.zeros((0, _dimension), dtype=np.float32)
+    if not _embedding_cache:
+        return _encode_with_model(texts, "item")
+
+    keys = [_embedding_cache.key(t) for t in texts]
+    vectors = _embedding_cache.get_many(keys)
+    missing = {k: t for k, t in zip(keys, texts) if k not in vectors}
+    if missing:
+        fresh = _encode_with_model(list(missing.values()), "item")
+        fresh_entries = dict(zip(missing.keys(), fresh))
+        _embedding_cache.put_many(fresh_entries)
+        vectors.update(fresh_entries)
+    metrics.inc("ilearn_embedding_cache_hits_total", len(texts) - len(missing))
+    log.debug(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} encoded.")
+    return np.vstack([vectors[k] for k in keys]).astype(np.float32)
+
+def _texts_to_embed(items: dict, ids, item_type: str) -> list:
     if item_type == "memory":
-        for mem_json_str in items_list:
-            try:
-                mem_obj = json.loads(mem_json_str)
-                texts_to_embed.append(f"User: {mem_obj.get('user_input', '')}\nAI: {mem_obj.get('bot_response', '')}\nTakeaway: {mem_obj.get('metrics', {}).get('takeaway', 'N/A')}")
-            except (json.JSONDecodeError, TypeError): continue
-    else: # Rules are just strings
-        texts_to_embed = items_list
-
-    if texts_to_embed:
-        embeddings = _embedder.encode(texts_to_embed, convert_to_numpy=True, show_progress_bar=False)
-        if embeddings.ndim == 2 and embeddings.shape[1] == _dimension:
-            index.add(embeddings.astype(np.float32))
+        return [items[i].embed_text for i in ids]
+    return [items[i] for i in ids] # Rules are just strings
+
+def _vectors_for(items: dict, ids: list, item_type: str, stored: dict = None) -> np.ndarray:
+    """Embeddings for `ids`: stored vectors where there are any; the rest are encoded and written back to SQLite."""
+    stored = stored or {}
+    missing = [i for i in ids if i not in stored]
+    fresh = {}
+    if missing:
+        fresh = dict(zip(missing, _encode_texts(_texts_to_embed(items, missing, item_type))))
+        if _sqlite_store:
+            _sqlite_store.store_vectors(item_type, fresh)
+            log.info(f"Stored embeddings for {len(fresh)} {item_type}s in SQLite.")
+    if not ids: return np.zeros((0, _dimension), dtype=np.float32)
+    return np.vstack([stored[i] if i in stored else fresh[i] for i in ids]).astype(np.float32, copy=False)
+
+def _build_faiss_index(items: dict, item_type: str, stored: dict = None):
+    """Helper to build an ID-mapped FAISS index from {id: MemoryRecord or rule string}."""
+    ids = list(items)
+    embeddings = _vectors_for(items, ids, item_type, stored)
+    if embeddings.ndim != 2 or embeddings.shape[1] != _dimension:
+        return build_index(_dimension, np.zeros((0, _dimension), dtype=np.float32), [])
+    return build_index(_dimension, embeddings, ids)
+
+def _snapshot_paths(item_type: str) -> tuple:
+    return (os.path.join(INDEX_SNAPSHOT_DIR, f"{item_type}.faiss"), os.path.join(INDEX_SNAPSHOT_DIR, f"{item_type}.meta.json"))
+
+def _load_index_snapshot(item_type: str):
+    """Returns the on-disk index snapshot, or None if there is none or it disagrees with the model or dimension."""
+    index_path, meta_path = _snapshot_paths(item_type)
+    if not (os.path.exists(index_path) and os.path.exists(meta_path)): return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("model") != _model_name or meta.get("dimension") != _dimension:
+            log.info(f"{item_type} index snapshot was built with a different model; rebuilding.")
+            return None
+        if meta.get("factory", "Flat") != indexing.INDEX_FACTORY:
+            log.info(f"{item_type} index snapshot was built for index type '{meta.get('factory')}'; rebuilding.")
+            return None
+        flags = getattr(faiss, "IO_FLAG_MMAP", 0) if INDEX_SNAPSHOT_MMAP else 0
+        index = faiss.read_index(index_path, flags)
+        if index.d != _dimension or index.ntotal != meta.get("ntotal") or not hasattr(index, "id_map"):
+            log.info(f"{item_type} index snapshot is inconsistent with its metadata; rebuilding.")
+            return None
+        indexing.keep_direct_map(index) # Raises for an IVF snapshot whose layout earlier removals broke
+        return index
+    except Exception as e:
+        log.warning(f"Could not load {item_type} index snapshot: {e}")
+        return None
+
+def _save_index_snapshot(index, item_type: str):
+    """Atomically writes the index and its metadata next to the data."""
+    index_path, meta_path = _snapshot_paths(item_type)
+    try:
+        os.makedirs(INDEX_SNAPSHOT_DIR, exist_ok=True)
+        faiss.write_index(index, index_path + ".tmp")
+        meta = {"model": _model_name, "dimension": _dimension, "factory": indexing.INDEX_FACTORY, "ntotal": index.ntotal, "saved_at": datetime.utcnow().isoformat()}
+        with open(meta_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(index_path + ".tmp", index_path)
+        os.replace(meta_path + ".tmp", meta_path)
+    except Exception as e:
+        log.error(f"Failed to save {item_type} index snapshot: {e}")
+
+def _load_or_build_faiss_index(items: dict, item_type: str, stored: dict = None):
+    """
+    Loads the index snapshot and reconciles it with the stored items by id: vectors of items that
+    are gone are removed, and only items the snapshot has never seen are added (from their stored
+    vectors, or encoded). Falls back to a full rebuild if the snapshot is missing or unusable.
+    """
+    if not INDEX_SNAPSHOT_ENABLED: return _build_faiss_index(items, item_type, stored)
+
+    index = _load_index_snapshot(item_type)
+    if index is not None:
+        apply_search_params(index)
+        snapshot_ids = set(indexed_ids(index).tolist())
+        stale_ids = [i for i in snapshot_ids if i not in items]
+        new_ids = [i for i in items if i not in snapshot_ids]
+        if not stale_ids and not new_ids: return index
+        try:
+            index = remove_ids(index, stale_ids)
+            add_with_ids(index, _vectors_for(items, new_ids, item_type, stored), new_ids)
+            index = maybe_upgrade(index)
+            log.info(f"Loaded {item_type} index snapshot; removed {len(stale_ids)} stale and added {len(new_ids)} new items.")
+        except Exception as e:
+            log.warning(f"Could not update {item_type} index snapshot ({e}); rebuilding.")
+            index = None
+    if index is None:
+        index = _build_faiss_index(items, item_type, stored)
+    _save_index_snapshot(index, item_type)
     return index
 
-def _persist_data(item_list: list, repo_name: str, col_name: str):
-    """Pushes a list of data to a Hugging Face Dataset."""
-    if STORAGE_BACKEND == "HF_DATASET" and HF_TOKEN and repo_name and Dataset:
+@shared.delegated
+def save_index_snapshots():
+    """Writes the current memory and rule indices to INDEX_SNAPSHOT_DIR so the next start can skip re-encoding."""
+    if not _initialized: return
+    for item_type, store in _stores.items():
+        _save_index_snapshot(store.compact().base, item_type)
+
+def _hub_client():
+    if HF_LOCAL_HUB_DIR: return persistence.LocalHubClient(HF_LOCAL_HUB_DIR)
+    if HF_TOKEN and datasets: return persistence.HFHubClient(HF_TOKEN)
+    return None
+
+def _start_persister(item_type: str, initial_items: list):
+    """Starts the write-behind persister for the HF_DATASET backend."""
+    col_name = "memory_json" if item_type == "memory" else "rule_text"
+    repo_name = HF_MEMORY_DATASET_REPO if item_type == "memory" else HF_RULES_DATASET_REPO
+    hub = _hub_client()
+    if STORAGE_BACKEND != "HF_DATASET" or not hub or not repo_name: return
+    persister = persistence.WriteBehindPersister(hub, repo_name, col_name, initial_items, max_pending=HF_PERSIST_MAX_PENDING,
+                                                 flush_interval=HF_PERSIST_FLUSH_INTERVAL, compact_every=HF_PERSIST_COMPACT_EVERY)
+    persistence.register_for_exit_flush(persister)
+    _persisters[item_type] = persister
+
+def _persist_data(item_type: str, op: str, values: list = ()):
+    """Queues a mutation ('add', 'remove' or 'clear') for the Hugging Face Dataset."""
+    persister = _persisters.get(item_type)
+    if persister: persister.record(op, values)
+
+@shared.delegated
+def flush():
+    """
+    Synchronously pushes all buffered HF_DATASET writes. Raises if a push fails; the writes stay
+    buffered and are retried in the background.
+    """
+    errors = []
+    for persister in list(_persisters.values()):
         try:
-            log.info(f"Pushing {len(item_list)} items to HF Hub: {repo_name}")
-            Dataset.from_dict({col_name: list(item_list)}).push_to_hub(repo_name, token=HF_TOKEN, private=True)
+            persister.flush()
         except Exception as e:
-            log.error(f"Failed to push to HF Dataset {repo_name}: {e}")
+            errors.append(f"{persister.repo}: {e}")
+    if errors: raise RuntimeError(f"Failed to push buffered writes ({'; '.join(errors)}).")
+
+def _new_memory(user_input: str, metrics: dict, bot_response: str, timestamp: str = None) -> tuple:
+    """Returns (memory_id, record, memory_json_str) for a new memory."""
+    record = MemoryRecord(user_input, bot_response, metrics, timestamp or datetime.utcnow().isoformat())
+    memory_json_str = record.to_json()
+    return item_id(memory_json_str), record, memory_json_str
 
+@shared.delegated
 def add_memory_entry(user_input: str, metrics: dict, bot_response: str):
-    if not _initialized: initialize_memory_system()
-    memory_obj = {"user_input": user_input, "metrics": metrics, "bot_response": bot_response, "timestamp": datetime.utcnow().isoformat()}
-    memory_json_str = json.dumps(memory_obj)
-    
-    text_to_embed = f"User: {user_input}\nAI: {bot_response}\nTakeaway: {metrics.get('takeaway', 'N/A')}"
-    embedding = _embedder.encode([text_to_embed], convert_to_numpy=True).astype(np.float32)
-    
-    _faiss_memory_index.add(embedding)
-    _memory_items_list.append(memory_json_str)
+    if not wait_until_ready(): initialize_memory_system()
+    memory_id, record, memory_json_str = _new_memory(user_input, metrics, bot_response)
+    if memory_id in _snapshot("memory"): return
+    embedding = _encode_texts([record.embed_text])
     
-    if STORAGE_BACKEND == "SQLITE":
-        with _get_sqlite_connection() as conn:
-            conn.execute("INSERT OR IGNORE INTO memories (memory_json) VALUES (?)", (memory_json_str,))
-            conn.commit()
-    _persist_data(_memory_items_list, HF_MEMORY_DATASET_REPO, "memory_json")
-
-def retrieve_memories_semantic(query: str, k: int = 3) -> list[dict]:
-    if not _initialized or _faiss_memory_index.ntotal == 0: return []
-    query_embedding = _embedder.encode([query], convert_to_numpy=True).astype(np.float32)
-    _, indices = _faiss_memory_index.search(query_embedding, min(k, _faiss_memory_index.ntotal))
-    return [json.loads(_memory_items_list[i]) for i in indices[0] if 0 <= i < len(_memory_items_list)]
+    with _stores["memory"].writing() as draft:
+        if not draft.add([memory_id], embedding, [record]): return # Added by another writer meanwhile
+        if _sqlite_store: _sqlite_store.add("memory", [(memory_id, memory_json_str, embedding[0])])
+        _persist_data("memory", "add", [memory_json_str])
+    _index_changed("memory")
+    if retention.MEMORY_MAX_ITEMS: _enforce_capacity()
 
+def _snapshot(item_type: str):
+    """The current immutable snapshot of a store. Take it once per operation and read only from it."""
+    return _stores[item_type].current
+
+def _index_changed(item_type: str):
+    """Bookkeeping after a write has published a new snapshot. Cached results are keyed by snapshot version, so they need no invalidation."""
+    if metrics.enabled():
+        metrics.set_gauge("ilearn_index_size", len(_snapshot(item_type)), store=item_type)
+
+def _embed_queries(queries: list) -> np.ndarray:
+    """Embeds queries, serving repeats from the in-process LRU cache and encoding all misses in one call."""
+    vectors = [_query_embedding_cache.get(q) for q in queries]
+    missing = list(dict.fromkeys(q for q, v in zip(queries, vectors) if v is None))
+    if missing:
+        fresh = dict(zip(missing, _encode_with_model(missing, "query")))
+        for q, v in fresh.items(): _query_embedding_cache.put(q, v)
+        vectors = [v if v is not None else fresh[q] for q, v in zip(queries, vectors)]
+    return np.vstack(vectors)
+
+def _search_ids(snapshot, query_embeddings: np.ndarray, k: int, item_type: str, where: filters.Filter = None) -> list:
+    """Runs one search of a snapshot for a batch of query vectors; returns the ids of its items per query."""
+    if not len(snapshot) or k <= 0: return [[] for _ in range(len(query_embeddings))]
+    with metrics.timed("ilearn_search_seconds", store=item_type, filtered=str(bool(where)).lower()):
+        return snapshot.search(query_embeddings, k, where)
+
+def _search_memories(query_embeddings: np.ndarray, k: int, where: filters.Filter = None) -> list:
+    snapshot = _snapshot("memory")
+    return [[snapshot[i].to_dict() for i in row] for row in _search_ids(snapshot, query_embeddings, k, "memory", where)]
+
+def _search_rules(query_embeddings: np.ndarray, k: int, where: filters.Filter = None) -> list:
+    snapshot = _snapshot("rule")
+    return [[snapshot[i] for i in row] for row in _search_ids(snapshot, query_embeddings, k, "rule", where)]
+
+def _cached_search_ids(snapshot, item_type: str, query: str, k: int, where: filters.Filter = None) -> list:
+    """Single-query search of a snapshot through the top-k result cache, which is keyed by the snapshot's version."""
+    cache_key = (item_type, query, k, snapshot.version, where.key if where else None)
+    ids = _result_cache.get(cache_key)
+    if ids is None:
+        ids = tuple(_search_ids(snapshot, _embed_queries([query]), k, item_type, where)[0])
+        _result_cache.put(cache_key, ids)
+    return ids
+
+def _memory_filter(since=None, until=None, min_score: float = None, has_takeaway: bool = None) -> filters.Filter:
+    return filters.Filter(min_score=min_score, since=since, until=until, has_takeaway=has_takeaway)
+
+def _rule_filter(rule_types=None, min_score: float = None) -> filters.Filter:
+    return filters.Filter(types=rule_types, min_score=min_score)
+
+@shared.delegated
+def retrieve_memories_semantic(query: str, k: int = 3, since=None, until=None, min_score: float = None, has_takeaway: bool = None) -> list[dict]:
+    """
+    Top-k memories for `query`, optionally only those with a timestamp in [`since`, `until`)
+    (epoch seconds, datetimes or ISO strings), a score metric of at least `min_score`, or with
+    (True) or without (False) a recorded takeaway. Filters are applied inside the search. When at
+    most FILTER_EXACT_MAX memories match, they are scored exactly and k are returned whenever that
+    many exist; larger matching sets are searched like an unfiltered query, so an approximate
+    index (IVF, HNSW) can return fewer.
+    """
+    if not wait_until_ready(): return []
+    snapshot = _snapshot("memory")
+    if not len(snapshot): return []
+    where = _memory_filter(since, until, min_score, has_takeaway)
+    return [snapshot[i].to_dict() for i in _cached_search_ids(snapshot, "memory", query, k, where)]
+
+@shared.delegated
 def add_rule_entry(rule_text: str):
-    if not _initialized: initialize_memory_system()
+    if not wait_until_ready(): initialize_memory_system()
     rule_text = rule_text.strip()
-    if not rule_text or rule_text in _rules_items_list: return
+    rule_id = item_id(rule_text)
+    if not rule_text or rule_id in _snapshot("rule"): return
 
-    embedding = _embedder.encode([rule_text], convert_to_numpy=True).astype(np.float32)
-    _faiss_rules_index.add(embedding)
-    _rules_items_list.append(rule_text)
-    _rules_items_list.sort()
-    
-    if STORAGE_BACKEND == "SQLITE":
-        with _get_sqlite_connection() as conn:
-            conn.execute("INSERT OR IGNORE INTO rules (rule_text) VALUES (?)", (rule_text,))
-            conn.commit()
-    _persist_data(_rules_items_list, HF_RULES_DATASET_REPO, "rule_text")
-
-def retrieve_rules_semantic(query: str, k: int = 5) -> list[str]:
-    if not _initialized or _faiss_rules_index.ntotal == 0: return []
-    query_embedding = _embedder.encode([query], convert_to_numpy=True).astype(np.float32)
-    _, indices = _faiss_rules_index.search(query_embedding, min(k, _faiss_rules_index.ntotal))
-    return [_rules_items_list[i] for i in indices[0] if 0 <= i < len(_rules_items_list)]
+    embedding = _encode_texts([rule_text])
+    with _stores["rule"].writing() as draft:
+        if not draft.add([rule_id], embedding, [rule_text]): return
+        if _sqlite_store: _sqlite_store.add("rule", [(rule_id, rule_text, embedding[0])])
+        _persist_data("rule", "add", [rule_text])
+    _index_changed("rule")
+
+@shared.delegated
+def retrieve_rules_semantic(query: str, k: int = 5, rule_types=None, min_score: float = None) -> list[str]:
+    """
+    Top-k rules for `query`, optionally only those whose `[TYPE|SCORE]` prefix has a type in
+    `rule_types` (e.g. {"CORE_RULE", "RESPONSE_PRINCIPLE"}) and a score of at least `min_score`.
+    """
+    if not wait_until_ready(): return []
+    snapshot = _snapshot("rule")
+    if not len(snapshot): return []
+    return [snapshot[i] for i in _cached_search_ids(snapshot, "rule", query, k, _rule_filter(rule_types, min_score))]
+
+@shared.delegated
+def retrieve_semantic_batch(queries: list[str], k_memories: int = 3, k_rules: int = 5, memory_filters: dict = None, rule_filters: dict = None) -> list[dict]:
+    """
+    Retrieves memories and rules for many queries with a single `encode` call and one
+    FAISS search per index. Returns one {"memories": [...], "rules": [...]} dict per query.
+    `memory_filters` and `rule_filters` take the filter arguments of `retrieve_memories_semantic`
+    and `retrieve_rules_semantic`, e.g. {"since": "2024-06-01"} and {"rule_types": ["CORE_RULE"]}.
+    """
+    queries = list(queries)
+    if not wait_until_ready() or not queries: return [{"memories": [], "rules": []} for _ in queries]
+    query_embeddings = _embed_queries(queries)
+    memories = _search_memories(query_embeddings, k_memories, _memory_filter(**(memory_filters or {})))
+    rules = _search_rules(query_embeddings, k_rules, _rule_filter(**(rule_filters or {})))
+    return [{"memories": m, "rules": r} for m, r in zip(memories, rules)]
 
+@shared.delegated
 def remove_rule_entry(rule_text_to_delete: str):
-    global _faiss_rules_index
-    if not _initialized or rule_text_to_delete not in _rules_items_list: return
+    rule_id = item_id(rule_text_to_delete)
+    if not wait_until_ready() or rule_id not in _snapshot("rule"): return
+
+    with _stores["rule"].writing() as draft:
+        if not draft.remove([rule_id]): return
+        if _sqlite_store: _sqlite_store.remove("rule", [rule_id])
+        _persist_data("rule", "remove", [rule_text_to_delete])
+    _index_changed("rule")
+    if _embedding_cache: _embedding_cache.discard([_embedding_cache.key(rule_text_to_delete)])
+
+@shared.delegated
+def replace_rule_entry(old_rule_text: str, new_rule_text: str):
+    """
+    Replaces one rule with another in place: only the new text is encoded, and the index is
+    updated with a single remove and add by id. This is how single 'update' operations from
+    `generate_rule_updates` should be applied; `apply_rule_updates` applies many at once.
+    """
+    if not wait_until_ready(): initialize_memory_system()
+    new_rule_text = new_rule_text.strip()
+    old_id, new_id = item_id(old_rule_text), item_id(new_rule_text)
+    if not new_rule_text or old_id == new_id: return
+    snapshot = _snapshot("rule")
+    if old_id not in snapshot: return add_rule_entry(new_rule_text)
+    if new_id in snapshot: return remove_rule_entry(old_rule_text)
+
+    embedding = _encode_texts([new_rule_text])
+    with _stores["rule"].writing() as draft:
+        swapped = old_id in draft and new_id not in draft
+        if swapped:
+            draft.remove([old_id])
+            draft.add([new_id], embedding, [new_rule_text])
+            if _sqlite_store: _sqlite_store.replace("rule", old_id, new_id, new_rule_text, embedding[0])
+            _persist_data("rule", "remove", [old_rule_text])
+            _persist_data("rule", "add", [new_rule_text])
+    if not swapped: return replace_rule_entry(old_rule_text, new_rule_text) # Another writer changed one of the two meanwhile
+    _index_changed("rule")
+    if _embedding_cache: _embedding_cache.discard([_embedding_cache.key(old_rule_text)])
+
+@shared.delegated
+def apply_rule_updates(operations) -> dict:
+    """
+    Applies 'add' and 'update' operations from the learning loop (see `generate_rule_updates` and
+    `curate_rules_batch`) as one batch, with the same result as applying them in order with
+    `add_rule_entry` and `replace_rule_entry` (an 'update' without an old rule adds its rule). New
+    rules are encoded in one call, and the index, SQLite (one transaction) and the HF dataset are
+    each updated once. Returns {"added": n, "removed": n}.
+    """
+    if not wait_until_ready(): initialize_memory_system()
+    snapshot = _snapshot("rule")
+    to_add, to_remove = {}, {} # id -> text, in the order the operations produced them
+    for op in operations:
+        action, new_text = (op.get("action") or "").lower(), (op.get("insight") or "").strip()
+        if action not in ("add", "update") or not new_text: continue
+        old_text, new_id = op.get("old_insight_to_replace") if action == "update" else None, item_id(new_text)
+        if old_text:
+            old_id = item_id(old_text)
+            if old_id == new_id: continue
+            if old_id in to_add: del to_add[old_id] # Added earlier in this batch
+            elif old_id in snapshot: to_remove[old_id] = old_text
+        if new_id in to_remove: del to_remove[new_id] # Removed earlier in this batch, so it simply stays
+        elif new_id not in snapshot: to_add[new_id] = new_text
+    if not to_add and not to_remove: return {"added": 0, "removed": 0}
+
+    embeddings = _encode_texts(list(to_add.values())) if to_add else []
+    with _stores["rule"].writing() as draft:
+        removed = draft.remove(list(to_remove))
+        added = set(draft.add(list(to_add), embeddings, list(to_add.values())))
+        rows = [(i, to_add[i], vector) for i, vector in zip(to_add, embeddings) if i in added]
+        if _sqlite_store: _sqlite_store.update("rule", removed, rows)
+        if removed: _persist_data("rule", "remove", [to_remove[i] for i in removed])
+        if rows: _persist_data("rule", "add", [rule_text for _, rule_text, _ in rows])
+    if removed or rows: _index_changed("rule")
+    if _embedding_cache and removed: _embedding_cache.discard([_embedding_cache.key(to_remove[i]) for i in removed])
+    return {"added": len(rows), "removed": len(removed)}
+
+def _batched(iterable, batch_size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch: yield batch
 
-    _rules_items_list.remove(rule_text_to_delete)
-    _faiss_rules_index = _build_faiss_index(_rules_items_list, "rule") # Rebuild index
+def _log_bulk_progress(item_type: str, done: int, started: float):
+    elapsed = time.perf_counter() - started
+    log.info(f"Bulk ingest: encoded {done} {item_type}s ({done / elapsed if elapsed > 0 else 0:.1f} items/s)")
 
-    if STORAGE_BACKEND == "SQLITE":
-        with _get_sqlite_connection() as conn:
-            conn.execute("DELETE FROM rules WHERE rule_text = ?", (rule_text_to_delete,))
-            conn.commit()
-    _persist_data(_rules_items_list, HF_RULES_DATASET_REPO, "rule_text")
+@shared.delegated
+def add_memories_bulk(memories, batch_size: int = None) -> int:
+    """
+    Adds many memories at once. `memories` is any iterable of dicts with `user_input`, `metrics`
+    and `bot_response` (and optionally `timestamp`). Texts are encoded in batches of `batch_size`,
+    then the index, SQLite (one transaction) and the HF dataset (one push) are each updated once.
+    Returns the number of memories added.
+    """
+    if not wait_until_ready(): initialize_memory_system()
+    batch_size = batch_size or BULK_BATCH_SIZE
+    started = time.perf_counter()
+    snapshot = _snapshot("memory")
+    new_items, new_jsons, embedding_batches = {}, {}, []
+    for batch in _batched(memories, batch_size):
+        prepared = []
+        for m in batch:
+            memory_id, record, mem_json = _new_memory(m["user_input"], m["metrics"], m["bot_response"], m.get("timestamp"))
+            if memory_id in snapshot or memory_id in new_items: continue
+            new_items[memory_id] = record
+            new_jsons[memory_id] = mem_json
+            prepared.append(record)
+        if not prepared: continue
+        embedding_batches.append(_encode_texts([r.embed_text for r in prepared]))
+        _log_bulk_progress("memory", len(new_items), started)
+    if not new_items: return 0
 
-def get_all_rules_cached() -> list[str]: return list(_rules_items_list)
-def get_all_memories_cached() -> list[dict]: return [json.loads(m) for m in _memory_items_list]
+    embeddings = np.vstack(embedding_batches)
+    with _stores["memory"].writing() as draft:
+        added = set(draft.add(list(new_items), embeddings, list(new_items.values())))
+        rows = [(i, new_jsons[i], vector) for i, vector in zip(new_items, embeddings) if i in added]
+        if _sqlite_store: _sqlite_store.add("memory", rows)
+        _persist_data("memory", "add", [mem_json for _, mem_json, _ in rows])
+    _index_changed("memory")
+    log.info(f"Bulk ingest: added {len(rows)} memories in {time.perf_counter() - started:.2f}s.")
+    if retention.MEMORY_MAX_ITEMS: _enforce_capacity()
+    return len(rows)
 
+@shared.delegated
+def add_rules_bulk(rules, batch_size: int = None) -> int:
+    """
+    Adds many rules at once, skipping blanks and duplicates. Encoding is batched like
+    `add_memories_bulk`, and each backend is written once. Returns the number of rules added.
+    """
+    if not wait_until_ready(): initialize_memory_system()
+    batch_size = batch_size or BULK_BATCH_SIZE
+    started = time.perf_counter()
+    snapshot = _snapshot("rule")
+    new_items, embedding_batches = {}, []
+    for batch in _batched((r.strip() for r in rules), batch_size):
+        fresh = {}
+        for rule_text in batch:
+            rule_id = item_id(rule_text)
+            if rule_text and rule_id not in snapshot and rule_id not in new_items: fresh[rule_id] = rule_text
+        if not fresh: continue
+        embedding_batches.append(_encode_texts(list(fresh.values())))
+        new_items.update(fresh)
+        _log_bulk_progress("rule", len(new_items), started)
+    if not new_items: return 0
+
+    embeddings = np.vstack(embedding_batches)
+    with _stores["rule"].writing() as draft:
+        added = set(draft.add(list(new_items), embeddings, list(new_items.values())))
+        rows = [(i, new_items[i], vector) for i, vector in zip(new_items, embeddings) if i in added]
+        if _sqlite_store: _sqlite_store.add("rule", rows)
+        _persist_data("rule", "add", [rule_text for _, rule_text, _ in rows])
+    _index_changed("rule")
+    log.info(f"Bulk ingest: added {len(rows)} rules in {time.perf_counter() - started:.2f}s.")
+    return len(rows)
+
+@shared.delegated
+def index_recall_report(item_type: str = "memory", k: int = 10, num_queries: int = 200, factory: str = None) -> dict:
+    """
+    Measures recall@k and search latency of the live index (or of a `factory` candidate built from
+    the same vectors) against exact search, using a sample of the stored vectors as queries.
+    Use it to choose FAISS_INDEX_FACTORY, FAISS_NPROBE and FAISS_EF_SEARCH safely.
+    """
+    if not wait_until_ready(): initialize_memory_system()
+    index = _stores[item_type].compact().base
+    if index.ntotal == 0: return {}
+    index = faiss.clone_index(index) # Reading every vector back can mutate an IVF index that readers are searching
+    ids, vectors = indexing.all_vectors(index)
+    if factory:
+        index = build_index(_dimension, vectors, ids.tolist(), factory=factory, train_threshold=0)
+    sample = np.random.default_rng(0).choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+    return indexing.recall_report(index, vectors[sample], k, label=factory)
+
+@shared.delegated
+def get_retrieval_cache_stats() -> dict:
+    """Hit/miss counters and sizes of the query-embedding and top-k result caches, for sizing them."""
+    return {"query_embeddings": _query_embedding_cache.stats(), "results": _result_cache.stats(),
+            "versions": {item_type: store.current.version for item_type, store in _stores.items()}}
+
+@shared.delegated
+def clear_retrieval_caches():
+    _query_embedding_cache.clear()
+    _result_cache.clear()
+
+@shared.delegated
+def get_all_rules_cached() -> list[str]:
+    if not wait_until_ready(): return []
+    return sorted(_snapshot("rule").values())
+
+@shared.delegated
+def iter_memories():
+    """Lazily yields every memory as a dict from one snapshot, without materializing the whole store."""
+    if not wait_until_ready(): return
+    for record in _snapshot("memory").values():
+        yield record.to_dict()
+
+@shared.delegated
+def get_all_memories_cached(offset: int = 0, limit: int = None) -> list[dict]:
+    """Returns memories as dicts, optionally one page of `limit` memories starting at `offset`."""
+    if not wait_until_ready(): return []
+    stop = None if limit is None else offset + limit
+    return [r.to_dict() for r in itertools.islice(_snapshot("memory").values(), offset, stop)]
+
+@shared.delegated
 def clear_all_memory_data_backend():
-    global _memory_items_list, _faiss_memory_index
-    if STORAGE_BACKEND == "SQLITE":
-        with _get_sqlite_connection() as conn: conn.execute("DELETE FROM memories"); conn.commit()
-    _memory_items_list = []
-    if _faiss_memory_index: _faiss_memory_index.reset()
-    _persist_data([], HF_MEMORY_DATASET_REPO, "memory_json")
+    if not wait_until_ready(): return
+    with _stores["memory"].writing() as draft:
+        draft.clear()
+        if _sqlite_store: _sqlite_store.clear("memory")
+        _persist_data("memory", "clear")
+    _index_changed("memory")
 
+@shared.delegated
 def clear_all_rules_data_backend():
-    global _rules_items_list, _faiss_rules_index
-    if STORAGE_BACKEND == "SQLITE":
-        with _get_sqlite_connection() as conn: conn.execute("DELETE FROM rules"); conn.commit()
-    _rules_items_list = []
-    if _faiss_rules_index: _faiss_rules_index.reset()
-    _persist_data([], HF_RULES_DATASET_REPO, "rule_text")
-
-def load_rules_from_file(filepath: str):
-    if not os.path.exists(filepath): return
+    if not wait_until_ready(): return
+    with _stores["rule"].writing() as draft:
+        draft.clear()
+        if _sqlite_store: _sqlite_store.clear("rule")
+        _persist_data("rule", "clear")
+    _index_changed("rule")
+
+def _evict_memories(ids: list, reason: str) -> int:
+    """Removes memories from the index, the items and the backend in one published snapshot. Returns the number removed."""
+    if not ids: return 0
+    with _stores["memory"].writing() as draft:
+        removed = draft.remove(ids)
+        if not removed: return 0
+        if _sqlite_store: _sqlite_store.remove("memory", removed)
+        _persist_data("memory", "remove_id", removed) # By id: a record's re-serialized JSON need not match the stored text
+    _index_changed("memory")
+    metrics.inc("ilearn_memories_evicted_total", len(removed), reason=reason)
+    log.info(f"Retention: evicted {len(removed)} memories ({reason}).")
+    return len(removed)
+
+def _enforce_capacity(max_items: int = None) -> int:
+    max_items = retention.MEMORY_MAX_ITEMS if max_items is None else max_items
+    snapshot = _snapshot("memory")
+    if not max_items or len(snapshot) <= max_items: return 0
+    return _evict_memories(retention.overflow_ids(snapshot.items(), len(snapshot), max_items), "over_capacity")
+
+@shared.delegated
+def apply_retention(max_items: int = None, max_age_days: float = None, min_score: float = None, now: float = None) -> dict:
+    """
+    Evicts memories older than `max_age_days`, those whose score metric is below `min_score`,
+    then the lowest-ranked ones while more than `max_items` remain (see ilearn_memory.retention).
+    Arguments default to MEMORY_MAX_AGE_DAYS, MEMORY_MIN_SCORE and MEMORY_MAX_ITEMS. Returns the
+    number evicted per reason. Capacity is also enforced after every add.
+    """
+    if not wait_until_ready(): return {}
+    max_age_days = retention.MEMORY_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    min_score = retention.MEMORY_MIN_SCORE if min_score is None else min_score
+    snapshot = _snapshot("memory")
+    return {"expired": _evict_memories(retention.expired_ids(snapshot.items(), max_age_days, now), "expired"),
+            "low_score": _evict_memories(retention.low_score_ids(snapshot.items(), min_score), "low_score"),
+            "over_capacity": _enforce_capacity(max_items)}
+
+@shared.delegated
+def compact_memories(threshold: float = None) -> int:
+    """
+    Drops near-duplicate memories: of each group whose embeddings have a cosine similarity of at
+    least `threshold` (default MEMORY_DEDUP_THRESHOLD), only the best-ranked memory is kept.
+    Returns the number dropped.
+    """
+    threshold = retention.MEMORY_DEDUP_THRESHOLD if threshold is None else threshold
+    if not wait_until_ready() or not threshold: return 0
+    snapshot = _stores["memory"].compact() # Every item is then in the base index, with no tombstones
+    if snapshot.base.ntotal < 2: return 0
+    ids, vectors = indexing.all_vectors(faiss.clone_index(snapshot.base))
+    ids = ids.tolist()
+    return _evict_memories(retention.near_duplicate_ids(ids, vectors, [retention.rank(snapshot[i]) for i in ids], threshold), "near_duplicate")
+
+def _retention_sweeper():
+    while True:
+        try:
+            apply_retention()
+            compact_memories()
+        except Exception as e:
+            log.error(f"Retention sweep failed: {e}", exc_info=True)
+        time.sleep(retention.MEMORY_RETENTION_INTERVAL)
+
+@shared.delegated
+def load_rules_from_file(filepath: str, batch_size: int = None) -> int:
+    if not os.path.exists(filepath): return 0
     with open(filepath, 'r', encoding='utf-8') as f:
         rules = re.split(r'\n\s*---\s*\n', f.read())
-        for rule in rules:
-            if rule.strip(): add_rule_entry(rule.strip())
+    return add_rules_bulk((rule for rule in rules if rule.strip()), batch_size)
+
+def _iter_memories_file(f):
+    for line in f:
+        if line.strip():
+            try:
+                mem = json.loads(line)
+                if all(k in mem for k in ["user_input", "bot_response", "metrics"]):
+                    yield mem
+            except json.JSONDecodeError: continue
 
-def load_memories_from_file(filepath: str):
-    if not os.path.exists(filepath): return
+@shared.delegated
+def load_memories_from_file(filepath: str, batch_size: int = None) -> int:
+    if not os.path.exists(filepath): return 0
     with open(filepath, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                try:
-                    mem = json.loads(line)
-                    if all(k in mem for k in ["user_input", "bot_response", "metrics"]):
-                        add_memory_entry(mem["user_input"], mem["metrics"], mem["bot_response"])
-                except json.JSONDecodeError: continue
+        return add_memories_bulk(_iter_memories_file(f), batch_size)
@@ -0,0 +1,191 @@
+import os
+import json
+import codecs
+import time
+import asyncio
+import logging
+import weakref
+import threading
+
+from .lazy import LazyModule
+
+httpx = LazyModule("httpx") # Imported on the first request
+
+log = logging.getLogger(__name__)
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "180"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+# Requests per minute, e.g. "groq=30,openai=500"; a bare number applies to every provider. Unset = unlimited
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+
+class TransportHTTPError(Exception):
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"HTTP {status_code}: {text}")
+        self.status_code, self.text = status_code, text
+
+class SSEParser:
+    """
+    Incremental Server-Sent Events parser. Feed it raw byte chunks as they arrive; it returns the
+    `data` payload of every event completed so far and keeps partial lines (and partial UTF-8
+    sequences) until the rest arrives.
+    """
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._buffer = ""
+        self._data_lines = []
+
+    def feed(self, chunk: bytes) -> list:
+        self._buffer += self._decoder.decode(chunk)
+        events = []
+        while True:
+            newline = min((i for i in (self._buffer.find("\r"), self._buffer.find("\n")) if i != -1), default=-1)
+            if newline == -1: break
+            if self._buffer[newline] == "\r" and newline + 1 == len(self._buffer): break # Could be half of "\r\n"
+            line = self._buffer[:newline]
+            skip = 2 if self._buffer.startswith("\r\n", newline) else 1
+            self._buffer = self._buffer[newline + skip:]
+            event = self._process_line(line)
+            if event is not None: events.append(event)
+        return events
+
+    def _process_line(self, line: str):
+        if not line: # Blank line dispatches the event
+            if not self._data_lines: return None
+            data, self._data_lines = "\n".join(self._data_lines), []
+            return data
+        if line.startswith(":"): return None # Comment
+        field, _, value = line.partition(":")
+        if field == "data":
+            self._data_lines.append(value[1:] if value.startswith(" ") else value)
+        return None
+
+    def close(self) -> list:
+        """Flushes an event left unterminated when the stream ends."""
+        events = self.feed(b"\n\n") if self._buffer or self._data_lines else []
+        return events
+
+class JSONStreamParser:
+    """
+    Incremental parser for a streamed JSON array of objects (`[{...},\\n{...}]`), as returned by
+    Google's streamGenerateContent. Returns every complete top-level object fed so far.
+    """
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+
+    def feed(self, chunk: bytes) -> list:
+        self._buffer += self._decoder.decode(chunk)
+        objects, pos = [], 0
+        while True:
+            while pos < len(self._buffer) and self._buffer[pos] in " \t\r\n,[]": pos += 1
+            if pos >= len(self._buffer): break
+            try:
+                obj, end = self._json.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                break # Incomplete object; wait for more bytes
+            objects.append(obj)
+            pos = end
+        self._buffer = self._buffer[pos:]
+        return objects
+
+class RateLimiter:
+    """
+    Spaces request starts at least 60/`per_minute` seconds apart. Slots are reserved under a
+    thread lock against a monotonic clock, so one limiter holds across event loops and threads.
+    """
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Claims the next slot and returns how many seconds to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        return start - now
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0: await asyncio.sleep(delay)
+
+def _parse_rate_limits(spec: str) -> dict:
+    """"groq=30,openai=500" -> {"groq": 30.0, "openai": 500.0}; a bare "60" -> {"*": 60.0}."""
+    limits = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.rpartition("=")
+        try:
+            limits[name.strip().lower() or "*"] = float(value)
+        except ValueError:
+            log.warning(f"Ignoring malformed LLM_RATE_LIMITS entry '{part}'.")
+    return limits
+
+_rate_limits = _parse_rate_limits(LLM_RATE_LIMITS)
+_rate_limiters, _rate_limiters_lock = {}, threading.Lock()
+
+def set_rate_limit(provider: str, per_minute: float = None):
+    """Sets the requests-per-minute limit for `provider` (None for no limit), overriding LLM_RATE_LIMITS."""
+    provider = provider.lower()
+    with _rate_limiters_lock:
+        _rate_limits[provider] = per_minute
+        _rate_limiters.pop(provider, None)
+
+def _get_rate_limiter(provider: str) -> RateLimiter | None:
+    per_minute = _rate_limits.get(provider, _rate_limits.get("*"))
+    if not per_minute or per_minute <= 0: return None
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(provider)
+        if limiter is None: limiter = _rate_limiters[provider] = RateLimiter(per_minute)
+    return limiter
+
+# One pooled client and concurrency limit per provider, per event loop (httpx clients are loop-bound)
+_clients = weakref.WeakKeyDictionary()
+_semaphores = weakref.WeakKeyDictionary()
+
+def _require_httpx():
+    if not httpx: raise ImportError("httpx is required for LLM streaming. Install it with `pip install httpx`.")
+
+def get_client(provider: str):
+    """Returns the shared keep-alive client for `provider` on the running event loop."""
+    _require_httpx()
+    loop = asyncio.get_running_loop()
+    clients = _clients.setdefault(loop, {})
+    client = clients.get(provider)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS, keepalive_expiry=LLM_KEEPALIVE_EXPIRY)
+        client = clients[provider] = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT))
+    return client
+
+def _get_semaphore(provider: str) -> asyncio.Semaphore:
+    semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    if provider not in semaphores: semaphores[provider] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return semaphores[provider]
+
+async def stream_post(provider: str, url: str, headers: dict, payload: dict, timeout: float = None):
+    """
+    POSTs `payload` as JSON on the provider's pooled client and yields raw response bytes as they
+    arrive. At most LLM_MAX_CONCURRENCY requests per provider are in flight and, with a rate limit
+    set (LLM_RATE_LIMITS), requests start no faster than it allows; others wait. Cancelling the consuming task closes the response and returns the connection to the pool.
+    """
+    client = get_client(provider)
+    request_timeout = httpx.Timeout(timeout or LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+    limiter = _get_rate_limiter(provider)
+    async with _get_semaphore(provider):
+        if limiter: await limiter.acquire() # Inside the semaphore, so queued requests cannot bunch up once slots free
+        async with client.stream("POST", url, headers=headers, json=payload, timeout=request_timeout) as response:
+            if response.status_code >= 400:
+                body = await response.aread()
+                raise TransportHTTPError(response.status_code, body.decode("utf-8", errors="replace")[:200])
+            async for chunk in response.aiter_bytes():
+                yield chunk
+
+async def aclose_clients():
+    """Closes the pooled clients that belong to the running event loop."""
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()